@@ -0,0 +1,143 @@
+import os
+import click
+
+import numpy as np
+import pandas as pd
+
+from loguru import logger
+from datetime import datetime
+from src.utilities.config_ import log_path, config_path, predicted_data_path
+
+import src.utilities.utils as utils
+import src.utilities.pipeline as pipeline
+import src.utilities.store as store
+
+# Accuracy columns stored as categoricals
+BACKTEST_CATEGORICAL_COLUMNS = ["material_desc", "Storage Location Code", "COGS Type", "Method"]
+
+
+def overall_wape(df):
+    # WAPE of the pooled series, every series weighs its observations
+    return (df["WAPE"] * df["Actual"]).sum() / df["Actual"].sum() if df["Actual"].sum() > 0 else np.nan
+
+
+@click.command()
+@click.option(
+    "--client",
+    required=True,
+    type=str,
+    help="Define which client that wants to be backtested.",
+)
+@click.option(
+    "--suffix",
+    "-s",
+    required=False,
+    type=str,
+    default="",
+    help="Suffix for the output names.",
+)
+@click.option(
+    "--sample",
+    type=bool,
+    default=False,
+    help="Set to True to limit to ~10 material codes per combination.",
+)
+@click.option(
+    "--workers",
+    "-w",
+    type=int,
+    default=1,
+    help="Number of worker processes used to backtest the series in parallel. 1 runs sequentially.",
+)
+@click.option(
+    "--origins",
+    type=int,
+    default=None,
+    help="Number of forecast origins, the last months of every series. Defaults to backtest_params.origins.",
+)
+@click.option(
+    "--horizon",
+    type=int,
+    default=None,
+    help="Months forecasted from every origin. Defaults to backtest_params.horizon.",
+)
+@click.option(
+    "--fast-path/--no-fast-path",
+    default=True,
+    help="Backtest all-zero, constant, too short and intermittent series with the cheap methods of main_predict.",
+)
+def main_backtest(
+    client,
+    suffix,
+    sample,
+    workers,
+    origins,
+    horizon,
+    fast_path
+):
+    container_date = datetime.now().strftime("%Y-%m-%d")
+    log_file = os.path.join(log_path, "run_backtest_" + container_date + ".log")
+    pipeline.configure_logger(log_file)
+
+    # load some config
+    params = utils.read_yaml(
+        os.path.join(config_path, "main_config.yaml"), render=True, suffix=suffix
+    )
+    backtest_feathername = params["run_forecasting_params"][client]["backtest_feathername"]
+    origins = origins or params["backtest_params"]["origins"]
+    horizon = horizon or params["backtest_params"]["horizon"]
+    series_timeout = params["fit_params"]["series_timeout"] or None
+
+    logger.info(
+        "Backtest Params- \n"
+        + f" Client: {client} |\n"
+        + f" Suffix: {suffix} |\n"
+        + f" Output File Name: {backtest_feathername} |\n"
+        + f" Workers: {workers} |\n"
+        + f" Origins: {origins} |\n"
+        + f" Horizon: {horizon} |\n"
+        + f" Fast Path: {fast_path} |\n"
+    )
+
+    # Aggregate and enumerate the series the same way main_predict does
+    df = store.read_client(client, columns=store.PIPELINE_COLUMNS)
+    tasks = pipeline.build_tasks(df, sample, keep_short=fast_path)
+    for task in tasks:
+        task["backtest"] = {"origins": origins, "horizon": horizon, "fast_path": fast_path}
+        task["timeout"] = series_timeout
+
+    # Longest series first, one at a time, so no worker is left with a long tail
+    tasks.sort(key=lambda task: len(task["df"]), reverse=True)
+    logger.info(f"Backtesting {len(tasks)} series over {origins} origins with {workers} worker(s)...")
+
+    rows = []
+    errors = 0
+    for task, (result, info, error) in zip(tasks, pipeline.run_backtest(tasks, workers, log_file, chunksize=1)):
+        if error is not None:
+            logger.info(f"Skipping Material {task['material']}, Storage {task['storage'] or 'All'}, {task['column']}: {error}")
+            errors += 1
+            continue
+        rows.append(result)
+
+    df_accuracy = pd.DataFrame(rows, columns=None if rows else ["Method", "MAPE", "WAPE", "Actual"])
+    for column in BACKTEST_CATEGORICAL_COLUMNS:
+        if column in df_accuracy:
+            df_accuracy[column] = df_accuracy[column].astype("category")
+
+    # Accuracy by method, then overall
+    for method, df_method in df_accuracy.groupby("Method", observed=True):
+        logger.info(
+            f"Backtest {method}: {len(df_method)} series, WAPE {overall_wape(df_method):.1%}, "
+            f"median MAPE {df_method['MAPE'].median():.1%}"
+        )
+    logger.info(
+        f"Backtest: {len(df_accuracy)} series, {errors} skipped, WAPE {overall_wape(df_accuracy):.1%}, "
+        f"median MAPE {df_accuracy['MAPE'].median():.1%}"
+    )
+
+    # save next to the forecasts
+    logger.info(f"Saving feather as {backtest_feathername}...")
+    utils.save(df_accuracy, os.path.join(predicted_data_path, backtest_feathername))
+
+if __name__ == "__main__":
+    main_backtest()
@@ -0,0 +1,209 @@
+import os
+import click
+
+from loguru import logger
+from datetime import datetime
+from src.utilities.config_ import log_path, config_path, predicted_data_path, cache_data_path, train_data_path, store_data_path
+
+import src.utilities.utils as utils
+import src.utilities.pipeline as pipeline
+import src.utilities.store as store
+from src.utilities.cache import ModelCache
+from src.utilities.writer import ResultWriter
+from src.utilities.profiling import RunProfile
+
+
+def discover_clients(params):
+    """
+    Clients configured in main_config.yaml that have training data,
+    either source CSVs or an ingested store.
+    """
+    clients = []
+    for client in params["run_forecasting_params"]:
+        if os.path.isdir(os.path.join(train_data_path, client)) or os.path.isdir(os.path.join(store_data_path, client)):
+            clients.append(client)
+        else:
+            logger.warning(f"Skipping client {client}: no training data found")
+    return clients
+
+
+@click.command()
+@click.option(
+    "--client",
+    "clients",
+    multiple=True,
+    type=str,
+    help="Client to forecast, can be repeated. Defaults to every configured client with training data.",
+)
+@click.option(
+    "--suffix",
+    "-s",
+    required=False,
+    type=str,
+    default="",
+    help="Suffix for the output names.",
+)
+@click.option(
+    "--sample",
+    type=bool,
+    default=False,
+    help="Set to True to limit every client to ~10 material codes per combination.",
+)
+@click.option(
+    "--workers",
+    "-w",
+    type=int,
+    default=1,
+    help="Number of worker processes shared by the series of every client. 1 runs sequentially.",
+)
+@click.option(
+    "--cache/--no-cache",
+    default=True,
+    help="Reuse cached forecasts of series whose data did not change since the last run.",
+)
+@click.option(
+    "--warm-start",
+    is_flag=True,
+    default=False,
+    help="Start each fit from the parameters of the previous run, skipping re-estimation for series that only got new months.",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(["sarimax", "ets"]),
+    default="sarimax",
+    help="Forecasting engine. ets fits all series of a length at once and falls back to SARIMAX for unstable ones.",
+)
+@click.option(
+    "--fast-path/--no-fast-path",
+    default=True,
+    help="Forecast all-zero, constant, too short and intermittent series with cheap methods instead of SARIMAX.",
+)
+@click.option(
+    "--series-timeout",
+    type=float,
+    default=None,
+    help="Seconds a series may spend fitting before it falls back to a seasonal naive forecast. Defaults to fit_params.series_timeout, 0 disables it.",
+)
+def main_batch(
+    clients,
+    suffix,
+    sample,
+    workers,
+    cache,
+    warm_start,
+    engine,
+    fast_path,
+    series_timeout
+):
+    container_date = datetime.now().strftime("%Y-%m-%d")
+    log_file = os.path.join(log_path, "run_forecasting_" + container_date + ".log")
+    pipeline.configure_logger(log_file)
+
+    # Structured stage and series timings, next to the log
+    profile = RunProfile(os.path.join(log_path, "run_forecasting_" + container_date + "_profile.jsonl"))
+
+    # load some config
+    params = utils.read_yaml(
+        os.path.join(config_path, "main_config.yaml"), render=True, suffix=suffix
+    )
+    clients = list(clients) or discover_clients(params)
+    if series_timeout is None:
+        series_timeout = params["fit_params"]["series_timeout"]
+
+    logger.info(
+        "Batch Forecasting Params- \n"
+        + f" Clients: {', '.join(clients)} |\n"
+        + f" Suffix: {suffix} |\n"
+        + f" Workers: {workers} |\n"
+        + f" Model Cache: {cache} |\n"
+        + f" Warm Start: {warm_start} |\n"
+        + f" Engine: {engine} |\n"
+        + f" Fast Path: {fast_path} |\n"
+        + f" Series Timeout: {series_timeout or None}s |\n"
+    )
+
+    model_cache = None
+    if cache:
+        model_cache = ModelCache(
+            os.path.join(cache_data_path, "models"),
+            max_size_mb=params["cache_params"]["max_size_mb"],
+        )
+
+    # Cache lookup, warm start and batched engine before the fit, bookkeeping of every fitted series after it
+    session = pipeline.FitSession(
+        profile,
+        os.path.join(cache_data_path, "warm_start"),
+        model_cache=model_cache,
+        engine=engine,
+        warm_start=warm_start,
+    )
+
+    # Enumerate the series of every client, a client that fails to load is skipped
+    failed = {}
+    writers = {}
+    tasks = []
+    for client in clients:
+        try:
+            pred_feathername = params["run_forecasting_params"][client]["predicted_feathername"]
+            df = store.read_client(client, columns=store.PIPELINE_COLUMNS)
+            client_tasks = pipeline.build_tasks(df, sample, keep_short=fast_path)
+        except Exception as error:
+            logger.error(f"Client {client} failed to load: {error}")
+            failed[client] = str(error)
+            continue
+
+        writers[client] = ResultWriter(
+            os.path.join(predicted_data_path, os.path.splitext(pred_feathername)[0] + "_parts"),
+            batch_rows=params["output_params"]["batch_rows"],
+        )
+        if fast_path:
+            methods = pipeline.route_series(client_tasks)
+            logger.info(f"Client {client}: fast path for {sum(methods.values())}/{len(client_tasks)} series")
+        for task in client_tasks:
+            task["client"] = client
+            task["timeout"] = series_timeout or None
+        tasks.extend(client_tasks)
+        logger.info(f"Client {client}: {len(client_tasks)} series")
+
+    session.prepare(tasks)
+
+    # Longest series to fit first, one at a time, so no worker is left with a long tail
+    tasks.sort(
+        key=lambda task: 0 if pipeline.precomputed(task) is not None else len(task["df"]),
+        reverse=True,
+    )
+    logger.info(f"Fitting {len(tasks)} series of {len(writers)} client(s) with {workers} worker(s)...")
+
+    with profile.stage("fit"):
+        for task, (result, info, error) in zip(tasks, pipeline.run_series(tasks, workers, log_file, chunksize=1)):
+            session.record(task, info, error)
+            writers[task["client"]].append(task, result)
+
+    # Write the output of every client, a failing client does not stop the others
+    for client, writer in writers.items():
+        try:
+            writer.flush()
+            df_results = writer.read()
+
+            pred_feathername = params["run_forecasting_params"][client]["predicted_feathername"]
+            logger.info(f"Client {client}: saving {len(df_results)} forecast rows as {pred_feathername}...")
+            utils.save(df_results, os.path.join(predicted_data_path, pred_feathername))
+
+            # Store the fitted params for the next warm-started run of the client
+            session.save_fits(client)
+        except Exception as error:
+            logger.error(f"Client {client} failed to save: {error}")
+            failed[client] = str(error)
+
+    # Log the fit effort, prune the model cache, then the slowest series and time lost on rejected fits
+    session.summary()
+    profile.summary()
+
+    if failed:
+        raise click.ClickException(
+            f"{len(failed)}/{len(clients)} client(s) failed: " + ", ".join(sorted(failed))
+        )
+    logger.info(f"All {len(clients)} client(s) forecasted")
+
+if __name__ == "__main__":
+    main_batch()
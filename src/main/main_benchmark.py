@@ -0,0 +1,263 @@
+import os
+import sys
+import json
+import glob
+import time
+import importlib
+import click
+import platform
+import resource
+import threading
+import tempfile
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+from loguru import logger
+from datetime import datetime
+from src.utilities.config_ import log_path, root_path
+
+import src.utilities.utils as utils
+import src.utilities.store as store
+import src.utilities.pipeline as pipeline
+import src.utilities.synthetic as synthetic
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """
+    Peak resident set size so far, in MB, of this process or, with
+    RUSAGE_CHILDREN, of its largest finished child (pool workers).
+    """
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def rss_mb():
+    """
+    Current resident set size of this process in MB, None where
+    /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+
+class RssSampler(threading.Thread):
+    """
+    Samples the resident set size of this process while a stage runs,
+    so a stage reports its own peak rather than the process-wide one.
+    """
+
+    def __init__(self, interval=0.01):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = rss_mb()
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def stop(self):
+        self.done.set()
+        self.join()
+        return self.peak
+
+
+class StageTimer(object):
+    """
+    Records the wall-clock time, throughput and memory of each stage:
+    the resident set size at its start and end and its peak in between.
+    A stage whose pool workers set a new children peak also reports it.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, func, *args, n_series=None, **kwargs):
+        rss_start = rss_mb()
+        children_start = peak_rss_mb(resource.RUSAGE_CHILDREN)
+        sampler = RssSampler() if rss_start is not None else None
+        if sampler is not None:
+            sampler.start()
+
+        start = time.perf_counter()
+        output = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+
+        stage = {"seconds": round(seconds, 4)}
+        if sampler is not None:
+            rss_peak = max(sampler.stop(), rss_mb())
+            rss_end = rss_mb()
+            stage["rss_start_mb"] = round(rss_start, 1)
+            stage["rss_end_mb"] = round(rss_end, 1)
+            stage["rss_peak_mb"] = round(rss_peak, 1)
+            stage["rss_growth_mb"] = round(rss_peak - rss_start, 1)
+        if peak_rss_mb(resource.RUSAGE_CHILDREN) > children_start:
+            stage["children_peak_rss_mb"] = round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1)
+        if n_series is not None:
+            stage["series"] = n_series
+            stage["series_per_sec"] = round(n_series / seconds, 2) if seconds > 0 else None
+        self.stages[name] = stage
+
+        logger.info(
+            f"{name}: {seconds:.3f}s"
+            + (f", {stage['series_per_sec']} series/sec" if n_series else "")
+            + (f", peak RSS +{stage['rss_growth_mb']} MB" if "rss_growth_mb" in stage else "")
+        )
+        return output
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=root_path, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_csvs(source_dir):
+    # Legacy loader: parse every yearly CSV and concatenate them
+    csv_files = glob.glob(os.path.join(source_dir, "*.csv"))
+    return pd.concat([pd.read_csv(file) for file in csv_files], ignore_index=True)
+
+
+@click.command()
+@click.option("--skus", type=int, default=200, help="Number of synthetic material codes.")
+@click.option("--storages", type=int, default=7, help="Number of synthetic storage locations.")
+@click.option("--years", type=str, default="2022,2023,2024", help="Comma-separated invoice years.")
+@click.option("--seed", type=int, default=0, help="Random seed of the generator.")
+@click.option("--workers", "-w", type=int, default=1, help="Number of worker processes for the SARIMAX stage.")
+@click.option(
+    "--max-series",
+    type=int,
+    default=200,
+    help="Number of series fitted in the SARIMAX stage, 0 fits all of them.",
+)
+@click.option("--output", type=str, default=None, help="Path of the JSON result. Defaults to logs/benchmarks/.")
+@click.option("--compare", type=str, default=None, help="Previous JSON result to compare against.")
+def main_benchmark(
+    skus,
+    storages,
+    years,
+    seed,
+    workers,
+    max_series,
+    output,
+    compare
+):
+    logger.remove()
+    logger.add(
+        sys.stderr,
+        colorize=True,
+        format="<green>{time}</green> | <yellow>{name}</yellow> | {level} |"
+        " <cyan>{message}</cyan>"
+    )
+
+    years = [int(year) for year in years.split(",")]
+    timer = StageTimer()
+
+    # Import the model code (and statsmodels) up front, so no timed stage pays for it
+    importlib.import_module("src.utilities.modeling")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_dir = os.path.join(tmp_dir, "training")
+        store_dir = os.path.join(tmp_dir, "store")
+
+        # Synthetic client shaped like the real CSVs
+        df_raw = timer.run(
+            "generate", synthetic.generate_invoices,
+            n_skus=skus, n_storages=storages, years=years, seed=seed,
+        )
+        timer.run("write_csv", synthetic.write_client_csvs, df_raw, source_dir)
+        n_rows = len(df_raw)
+        del df_raw
+
+        # Loading: legacy CSV parsing against the columnar store
+        timer.run("load_csv", read_csvs, source_dir)
+        timer.run("ingest", store.ingest_client, "synthetic", force=True, source_dir=source_dir, store_dir=store_dir)
+        df = timer.run(
+            "read_store", store.read_client, "synthetic",
+            columns=store.PIPELINE_COLUMNS, source_dir=source_dir, store_dir=store_dir,
+        )
+
+    # Aggregation stages, timed on their own
+    df_grouped = timer.run("preprocess_df", lambda: [utils.preprocess_df(df, outlier) for outlier in pipeline.OUTLIERS])
+    timer.run("all_storage_grouper", lambda: [utils.all_storage_grouper(frame) for frame in df_grouped])
+
+    # Partitioning and series enumeration as done by main_predict
+    tasks = timer.run("build_tasks", pipeline.build_tasks, df)
+    timer.stages["build_tasks"]["series"] = len(tasks)
+
+    # Batched engine over every series
+    timer.run("batch_forecast", pipeline.batch_forecast, [dict(task) for task in tasks], n_series=len(tasks))
+
+    # SARIMAX on an evenly spread subset of the series
+    if max_series and len(tasks) > max_series:
+        fit_tasks = [tasks[i] for i in np.linspace(0, len(tasks) - 1, max_series).astype(int)]
+    else:
+        fit_tasks = tasks
+    timer.run(
+        "train_predict", lambda: list(pipeline.run_series(fit_tasks, workers)), n_series=len(fit_tasks),
+    )
+
+    # Read before git_commit, whose forked git process would count as a child
+    peak_rss = {
+        "self": round(peak_rss_mb(resource.RUSAGE_SELF), 1),
+        "children": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+    }
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "params": {
+            "skus": skus,
+            "storages": storages,
+            "years": years,
+            "seed": seed,
+            "workers": workers,
+            "max_series": max_series,
+        },
+        "rows": n_rows,
+        "series": len(tasks),
+        "peak_rss_mb": peak_rss,
+        "stages": timer.stages,
+    }
+
+    if output is None:
+        output = os.path.join(
+            log_path, "benchmarks", "benchmark_" + datetime.now().strftime("%Y-%m-%d_%H%M%S") + ".json"
+        )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    logger.info(
+        f"{n_rows} rows, {len(tasks)} series, peak RSS {result['peak_rss_mb']['self']} MB "
+        f"(children {result['peak_rss_mb']['children']} MB). Saved to {output}"
+    )
+
+    # Stage by stage comparison against a previous result
+    if compare:
+        with open(compare) as f:
+            previous = json.load(f)
+        if previous["params"] != result["params"]:
+            logger.warning("Benchmark parameters differ from the compared result")
+        for name, stage in result["stages"].items():
+            if name in previous["stages"] and previous["stages"][name]["seconds"] > 0:
+                ratio = stage["seconds"] / previous["stages"][name]["seconds"]
+                growth = (
+                    f", peak RSS +{previous['stages'][name]['rss_growth_mb']} → +{stage['rss_growth_mb']} MB"
+                    if "rss_growth_mb" in stage and "rss_growth_mb" in previous["stages"][name] else ""
+                )
+                logger.info(
+                    f"{name}: {previous['stages'][name]['seconds']:.3f}s → {stage['seconds']:.3f}s ({ratio:.2f}x){growth}"
+                )
+
+if __name__ == "__main__":
+    main_benchmark()
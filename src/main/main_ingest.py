@@ -0,0 +1,50 @@
+import os
+import sys
+import click
+
+from loguru import logger
+from src.utilities.config_ import train_data_path
+
+import src.utilities.store as store
+
+@click.command()
+@click.option(
+    "--client",
+    required=False,
+    type=str,
+    default=None,
+    help="Client whose CSVs are ingested. Defaults to every client under data/training.",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Convert every CSV, even the ones that did not change since the last ingest.",
+)
+def main_ingest(
+    client,
+    force
+):
+    logger.remove()
+    logger.add(
+        sys.stderr,
+        colorize=True,
+        format="<green>{time}</green> | <yellow>{name}</yellow> | {level} |"
+        " <cyan>{message}</cyan>"
+    )
+
+    # Ingest one client, or every client folder under data/training
+    if client:
+        clients = [client]
+    else:
+        clients = sorted(
+            name for name in os.listdir(train_data_path)
+            if os.path.isdir(os.path.join(train_data_path, name))
+        )
+
+    for name in clients:
+        converted = store.ingest_client(name, force=force)
+        logger.info(f"Client {name}: {len(converted)} CSV file(s) converted")
+
+if __name__ == "__main__":
+    main_ingest()
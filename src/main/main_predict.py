@@ -2,15 +2,22 @@ import pandas as pd
 import numpy as np
 import os 
 import sys
+import time
 import click
 import glob
 
 from loguru import logger
 from datetime import datetime, timedelta
-from src.utilities.config_ import log_path, ConfigManager, config_path, morgan_train_data_path, predicted_data_path, ferrero_train_data_path
-from itertools import product
+from src.utilities.config_ import log_path, ConfigManager, config_path, predicted_data_path, cache_data_path, train_data_path
 
 import src.utilities.utils as utils
+import src.utilities.pipeline as pipeline
+import src.utilities.store as store
+import src.utilities.aggregates as aggregates
+from src.utilities.schema import compact_output
+from src.utilities.cache import ModelCache
+from src.utilities.writer import ResultWriter
+from src.utilities.profiling import RunProfile, start_cpu_profile, dump_cpu_profile
 
 @click.command()
 @click.option(
@@ -33,24 +40,129 @@ import src.utilities.utils as utils
     type=bool,
     help="Set to True to perform sampling (limit to ~10 material codes), or False to disable sampling."
 )
+@click.option(
+    "--workers",
+    "-w",
+    type=int,
+    default=1,
+    help="Number of worker processes used to fit the series. 1 runs sequentially.",
+)
+@click.option(
+    "--cache/--no-cache",
+    default=True,
+    help="Reuse cached forecasts of series whose data did not change since the last run.",
+)
+@click.option(
+    "--warm-start",
+    is_flag=True,
+    default=False,
+    help="Start each fit from the parameters of the previous run, skipping re-estimation for series that only got new months.",
+)
+@click.option(
+    "--candidate-workers",
+    type=int,
+    default=1,
+    help="Number of worker processes fitting the seasonal period candidates of a series in parallel. Only used with --workers=1.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="Resume an interrupted run from its last flushed batch of forecasts.",
+)
+@click.option(
+    "--export-csv",
+    is_flag=True,
+    default=False,
+    help="Also export the forecasts as CSV.",
+)
+@click.option(
+    "--engine",
+    type=click.Choice(["sarimax", "ets"]),
+    default="sarimax",
+    help="Forecasting engine. ets fits all series of a length at once and falls back to SARIMAX for unstable ones.",
+)
+@click.option(
+    "--fast-path/--no-fast-path",
+    default=True,
+    help="Forecast all-zero, constant, too short and intermittent series with cheap methods instead of SARIMAX.",
+)
+@click.option(
+    "--multi-target",
+    is_flag=True,
+    default=False,
+    help="Fit the RM, EA and CTN measures of a series together, trying the seasonal period chosen for RM first for EA and CTN.",
+)
+@click.option(
+    "--hierarchy",
+    type=click.Choice(["independent", "bottom-up"]),
+    default="independent",
+    help="How the All storage series are forecasted: fitted on their own, or as the mean of the storage forecasts.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="Merge only new invoice lines into the persisted monthly aggregates and refit only the series that changed.",
+)
+@click.option(
+    "--chunked",
+    is_flag=True,
+    default=False,
+    help="Aggregate the source CSVs chunk by chunk instead of loading every invoice line, for clients larger than memory.",
+)
+@click.option(
+    "--series-timeout",
+    type=float,
+    default=None,
+    help="Seconds a series may spend fitting before it falls back to a seasonal naive forecast. Defaults to fit_params.series_timeout, 0 disables it.",
+)
+@click.option(
+    "--time-budget",
+    type=float,
+    default=None,
+    help="Minutes the run may spend. Series are fitted by decreasing COGS value and the ones left when it runs out fall back to a seasonal naive forecast.",
+)
+@click.option(
+    "--cprofile",
+    is_flag=True,
+    default=False,
+    help="Profile the run with cProfile and save the stats next to the log. Use with --workers=1 to include the fits.",
+)
 def main_predict(
     client,
     suffix,
-    sample
+    sample,
+    workers,
+    cache,
+    warm_start,
+    candidate_workers,
+    resume,
+    export_csv,
+    engine,
+    fast_path,
+    multi_target,
+    hierarchy,
+    incremental,
+    chunked,
+    series_timeout,
+    time_budget,
+    cprofile
 ):
+    if incremental and resume:
+        raise click.UsageError("--incremental cannot be combined with --resume")
+    if incremental and sample:
+        # A sampled run would take every series left out of the sample as removed and drop its forecasts
+        raise click.UsageError("--incremental cannot be combined with --sample")
+
+    run_start = time.time()
     container_date = datetime.now().strftime("%Y-%m-%d")
-    logger.remove()
-    logger.add(
-        os.path.join(log_path, "run_forecasting_" + container_date + ".log"),
-        format="<green>{time}</green> | <yellow>{name}</yellow> | {level} |"
-        " <cyan>{message}</cyan>"
-    )
-    logger.add(
-        sys.stderr,
-        colorize=True,
-        format="<green>{time}</green> | <yellow>{name}</yellow> | {level} |"
-        " <cyan>{message}</cyan>"
-    )
+    log_file = os.path.join(log_path, "run_forecasting_" + container_date + ".log")
+    pipeline.configure_logger(log_file)
+
+    # Structured stage and series timings, next to the log
+    profile = RunProfile(os.path.join(log_path, "run_forecasting_" + container_date + "_profile.jsonl"))
+    profiler = start_cpu_profile() if cprofile else None
 
     # load some config
     params = utils.read_yaml(
@@ -60,116 +172,209 @@ def main_predict(
     # set predicted feathername by mapping the input
     pred_feathername = f'{params["run_forecasting_params"][client]["predicted_feathername"]}'
     pred_csvname = f'{params["run_forecasting_params"][client]["predicted_csvname"]}'
-
-    # training data path mapping based on client value
-    training_data = {
-        "morgan" : morgan_train_data_path,
-        "ferrero" : ferrero_train_data_path
-        # soon to be added
-    }
+    if series_timeout is None:
+        series_timeout = params["fit_params"]["series_timeout"]
 
     logger.info(
         "Sentiment Forecasting Params- \n"
         + f" Client: {client} |\n"
         + f" Suffix: {suffix} |\n"
         + f" Output File Name: {pred_feathername} |\n"
+        + f" Workers: {workers} |\n"
+        + f" Candidate Workers: {candidate_workers} |\n"
+        + f" Model Cache: {cache} |\n"
+        + f" Warm Start: {warm_start} |\n"
+        + f" Resume: {resume} |\n"
+        + f" Engine: {engine} |\n"
+        + f" Fast Path: {fast_path} |\n"
+        + f" Multi-Target: {multi_target} |\n"
+        + f" Hierarchy: {hierarchy} |\n"
+        + f" Incremental: {incremental} |\n"
+        + f" Chunked: {chunked} |\n"
+        + f" Series Timeout: {series_timeout or None}s |\n"
+        + f" Time Budget: {time_budget} min |\n"
     )
 
-    # Get all CSV files in the directory
-    csv_files = glob.glob(os.path.join(training_data[client], "*.csv"))
+    # Incremental runs keep the monthly aggregates of every CSV between runs
+    aggregates_dir = os.path.join(cache_data_path, "aggregates", client)
+    chunk_rows = params["preprocess_params"]["chunk_rows"]
+    aggregate_state = aggregates.AggregateState(aggregates_dir, chunk_rows) if incremental else None
+
+    with profile.stage("load"):
+        if incremental:
+            # Merge only the invoice lines added since the last run
+            changes = aggregate_state.update(os.path.join(train_data_path, client))
+            logger.info(f"Incremental: {len(changes)} source file(s) changed since the last run")
+        elif chunked:
+            # Stream the invoice lines into monthly aggregates, memory is bounded by the number of series
+            merged = aggregates.aggregate_client(os.path.join(train_data_path, client), chunk_rows)
+        else:
+            # Read the training data from the columnar store, refreshed if a CSV changed
+            df = store.read_client(client, columns=store.PIPELINE_COLUMNS)
 
-    # Read each CSV into a DataFrame and store them in a list
-    dataframes = [pd.read_csv(file) for file in csv_files]
+    # Aggregate, partition and enumerate every series to fit, in a fixed order
+    with profile.stage("preprocess"):
+        if incremental or chunked:
+            if incremental:
+                merged = aggregate_state.merged()
+            partitions = {
+                outlier: utils.partition_grouped(aggregates.finalize(merged, outlier))
+                for outlier in pipeline.OUTLIERS
+            }
+            tasks = pipeline.enumerate_tasks(partitions, sample, keep_short=fast_path)
+        else:
+            tasks = pipeline.build_tasks(df, sample, keep_short=fast_path)
+        for task in tasks:
+            task["client"] = client
 
-    # Optionally, concatenate all DataFrames into one
-    df = pd.concat(dataframes, ignore_index=True).reset_index(drop=True)
+    # Only new or changed series are refitted, the output keeps the rows of the others
+    output_file = os.path.join(predicted_data_path, pred_feathername)
+    digest_file = os.path.join(aggregates_dir, os.path.splitext(pred_feathername)[0] + "_series.pkl")
+    previous_results = None
+    if incremental:
+        previous_digests = (
+            utils.load(digest_file) if os.path.exists(digest_file) and os.path.exists(output_file) else {}
+        )
+        current_digests = {pipeline.result_key(task): pipeline.series_digest(task) for task in tasks}
+        replaced = {key for key, digest in previous_digests.items() if current_digests.get(key) != digest}
+        tasks = [
+            task for task in tasks
+            if previous_digests.get(pipeline.result_key(task)) != current_digests[pipeline.result_key(task)]
+        ]
+        if previous_digests:
+            previous_results = utils.load(output_file)
+        logger.info(
+            f"Incremental: {len(tasks)} new or changed series, "
+            f"{len(replaced - set(current_digests))} removed, {len(current_digests) - len(tasks)} unchanged"
+        )
 
-    # Hyperparameters :)
-    COLUMN = ["AVG Total RM", "AVG Total EA", "AVG Total CTN"]
-    STORAGE_TYPE = ["All", "Specific"]
-    OUTLIER = [True, False]
+    # Forecasts are flushed in batches next to the output file, a resumed run skips the flushed series
+    writer = ResultWriter(
+        os.path.join(predicted_data_path, os.path.splitext(pred_feathername)[0] + "_parts"),
+        batch_rows=params["output_params"]["batch_rows"],
+        resume=resume,
+    )
+    if resume:
+        done_keys = writer.done_keys()
+        tasks = [task for task in tasks if tuple(writer.series_key(task)) not in done_keys]
+        logger.info(f"Resuming: {len(done_keys)} series already flushed, {len(tasks)} left")
 
-    # Store a new empty list for the final result
-    results = []
+    # Degenerate series get a cheap forecast, SARIMAX only sees the series it can fit
+    if fast_path:
+        with profile.stage("fast_path"):
+            methods = pipeline.route_series(tasks)
+        logger.info(
+            f"Fast path: {sum(methods.values())}/{len(tasks)} series routed off SARIMAX ("
+            + ", ".join(f"{n} {method}" for method, n in sorted(methods.items())) + ")"
+        )
 
-    # Iterate over all parameter combinations
-    for idx, (col, storage_type, outlier) in enumerate(product(COLUMN, STORAGE_TYPE, OUTLIER), start=1):
-        logger.info(f"Running {idx}/12 → COLUMN={col}, STORAGE_TYPE={storage_type}, OUTLIER={outlier}")
+    # Bottom-up runs fit the storage level first, the "All" series are derived from it afterwards
+    all_tasks = []
+    if hierarchy == "bottom-up":
+        all_tasks = [task for task in tasks if task["storage"] is None]
+        tasks = [task for task in tasks if task["storage"] is not None]
 
-        # Preprocess data once per OUTLIER setting
-        df_grouped = utils.preprocess_df(df, outlier)
-        
-        # Apply grouping if storage_type is "All"
-        if storage_type != "Specific":
-            df_grouped = utils.all_storage_grouper(df_grouped)
-            material_storage_pairs = ((m, None) for m in df_grouped["Material Code"].unique())  # Use (material, None) pairs
-        else:
-            material_storage_pairs = product(df_grouped["Material Code"].unique(), df_grouped["Storage Location Code"].unique())
-
-        # Iterate over material-storage pairs (up to LOOP_VALUE)
-        for i, (material, storage) in enumerate(material_storage_pairs):
-            if sample:
-                if i >= 10: 
-                    break  # Stop early if sample = True
-
-            # Efficient DataFrame filtering using .query()
-            if storage:
-                df_sample = df_grouped.query("`Material Code` == @material and `Storage Location Code` == @storage")
-            else:
-                df_sample = df_grouped.query("`Material Code` == @material")
-
-            # Skip if DataFrame is empty
-            if df_sample.empty:
-                continue
-
-            try:
-                # Train and forecast
-                forecast = utils.train_predict(df_sample, col)
-
-                # Post-process and plot results
-                future_dates = utils.postprocess(df_sample, forecast, col, False)
-
-                # Determine COGS Type
-                cogs_type = "RM" if col == "AVG Total RM" else "EA" if col == "AVG Total EA" else "CTN"
-                # print(df_sample)
-                material_group_code = df_sample["Material Group Code"].values[0]
-                material_group_desc = df_sample["Material Group Desc"].values[0]
-                material_desc = df_sample["Material Desc"].values[0]
-
-                # Store results
-                results.extend([
-                    {
-                        "Date": future_date,
-                        "material_group_code" : material_group_code,
-                        "material_group_desc" : material_group_desc,
-                        "material_desc" : material_desc,
-                        "Material Code": material,
-                        "Storage Location Code": storage if storage else "All",
-                        "COGS Type": cogs_type,
-                        "COGS Value": value,
-                        "Outlier": outlier
-                    }
-                    for future_date, value in zip(future_dates, forecast)
-                ])
-
-            except Exception as error:
-                print(f"⚠️ Error for Material {material}: {error}")
-                continue
-
-    # Convert results list into a DataFrame
-    df_results = pd.DataFrame(results)
-    print(df_results)
-
-    # Postprocess data type
-    df_results["Storage Location Code"] = df_results["Storage Location Code"].astype(str)
+    # Multi-target runs fit the measures of a series one after the other
+    if multi_target:
+        tasks = pipeline.order_by_series(tasks)
+        all_tasks = pipeline.order_by_series(all_tasks)
 
-    # save
-    logger.info(f"Saving feather as {pred_feathername}...")
-    utils.save(df_results, os.path.join(predicted_data_path, pred_feathername))
+    model_cache = None
+    if cache:
+        model_cache = ModelCache(
+            os.path.join(cache_data_path, "models"),
+            max_size_mb=params["cache_params"]["max_size_mb"],
+        )
+
+    # Cache lookup, warm start and batched engine before every pass, bookkeeping of every fitted series after it
+    session = pipeline.FitSession(
+        profile,
+        os.path.join(cache_data_path, "warm_start"),
+        model_cache=model_cache,
+        engine=engine,
+        warm_start=warm_start,
+        multi_target=multi_target,
+    )
+    session.prepare(tasks)
+
+    # Bound every fit, with a budget the most valuable series are fitted first
+    deadline = run_start + time_budget * 60 if time_budget else None
+    for task in tasks + all_tasks:
+        task["timeout"] = series_timeout or None
+        task["deadline"] = deadline
+    if time_budget:
+        tasks = pipeline.prioritize(tasks)
+        all_tasks = pipeline.prioritize(all_tasks)
+        logger.info(f"Time budget: fits stop at {datetime.fromtimestamp(deadline):%H:%M:%S}, series ordered by COGS value")
+    chunksize = 1 if time_budget else None
+
+    logger.info(f"Fitting {len(tasks)} series with {workers} worker(s)...")
+
+    # Rows of the previous output that this run does not replace
+    if previous_results is not None:
+        kept = ~pipeline.result_keys(previous_results).isin(list(replaced))
+
+    def fit_passes():
+        yield from zip(
+            tasks, pipeline.run_series(tasks, workers, log_file, candidate_workers, chunksize, multi_target)
+        )
+        if not all_tasks:
+            return
+
+        # Derive the "All" series from every storage forecast, the ones not covered are fitted directly
+        writer.flush()
+        df_forecasts = writer.read()
+        if previous_results is not None:
+            df_forecasts = pd.concat([previous_results[kept], df_forecasts], ignore_index=True)
+        n_reconciled = pipeline.reconcile_bottom_up(all_tasks, df_forecasts)
+        logger.info(f"Bottom-up: {n_reconciled}/{len(all_tasks)} All series derived from the storage forecasts")
+
+        # The All series left to fit go through the cache, warm start and batched engine like the storage level
+        session.prepare(all_tasks)
+        yield from zip(
+            all_tasks, pipeline.run_series(all_tasks, workers, log_file, candidate_workers, chunksize, multi_target)
+        )
+
+    # Train and forecast, results come back in task order
+    with profile.stage("fit"):
+        for task, (result, info, error) in fit_passes():
+            session.record(task, info, error)
+            writer.append(task, result)
+
+        writer.flush()
+
+    # Gather the flushed batches into the output file
+    df_results = writer.read()
+    logger.info(f"{len(df_results)} forecast rows written")
+
+    # Replace the rows of the refitted and removed series in the previous output
+    if previous_results is not None:
+        df_results = compact_output(pd.concat([previous_results[kept], df_results], ignore_index=True))
+        logger.info(f"Incremental: kept {kept.sum()} forecast rows of the previous output")
 
     # save
-    logger.info(f"Saving CSV as {pred_feathername}...")
-    df_results.to_csv(os.path.join(predicted_data_path, pred_csvname))
+    with profile.stage("save"):
+        logger.info(f"Saving feather as {pred_feathername}...")
+        utils.save(df_results, output_file)
+
+        # save
+        if export_csv:
+            logger.info(f"Saving CSV as {pred_csvname}...")
+            df_results.to_csv(os.path.join(predicted_data_path, pred_csvname))
+
+    # The aggregates and series digests now match the saved output
+    if incremental:
+        aggregate_state.save()
+        utils.save(current_digests, digest_file)
+
+    # Store the fitted params for the next warm-started run, log the fit effort and prune the model cache
+    session.save_fits(client)
+    session.summary()
+
+    # Slowest series and time lost on rejected fits
+    profile.summary()
+    if profiler is not None:
+        dump_cpu_profile(profiler, os.path.join(log_path, "run_forecasting_" + container_date + ".prof"))
 
 if __name__ == "__main__":
     main_predict()
\ No newline at end of file
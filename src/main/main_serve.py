@@ -0,0 +1,81 @@
+import os
+import sys
+import click
+
+from loguru import logger
+from src.utilities.config_ import config_path, predicted_data_path
+
+import src.utilities.utils as utils
+from src.utilities.serving import ForecastStore, make_server
+
+@click.command()
+@click.option(
+    "--client",
+    "clients",
+    multiple=True,
+    type=str,
+    help="Client to serve, can be repeated. Defaults to every configured client.",
+)
+@click.option(
+    "--suffix",
+    "-s",
+    required=False,
+    type=str,
+    default="",
+    help="Suffix of the forecast files to serve.",
+)
+@click.option(
+    "--host",
+    type=str,
+    default=None,
+    help="Interface to listen on. Defaults to serving_params.host.",
+)
+@click.option(
+    "--port",
+    type=int,
+    default=None,
+    help="Port to listen on, 0 picks a free one. Defaults to serving_params.port.",
+)
+def main_serve(
+    clients,
+    suffix,
+    host,
+    port
+):
+    logger.remove()
+    logger.add(
+        sys.stderr,
+        colorize=True,
+        format="<green>{time}</green> | <yellow>{name}</yellow> | {level} |"
+        " <cyan>{message}</cyan>",
+        level="INFO",
+    )
+
+    # load some config
+    params = utils.read_yaml(
+        os.path.join(config_path, "main_config.yaml"), render=True, suffix=suffix
+    )
+    clients = list(clients) or list(params["run_forecasting_params"])
+    host = host or params["serving_params"]["host"]
+    port = params["serving_params"]["port"] if port is None else port
+
+    # Forecast files are loaded up front and reloaded whenever main_predict rewrites them
+    store = ForecastStore({
+        client: os.path.join(predicted_data_path, params["run_forecasting_params"][client]["predicted_feathername"])
+        for client in clients
+    })
+    for client, status in store.status().items():
+        if "error" in status:
+            logger.warning(f"Client {client}: {status['error']}")
+
+    server = make_server(store, host, port)
+    logger.info(f"Serving forecasts of {', '.join(clients)} on http://{server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main_serve()
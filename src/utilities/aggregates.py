@@ -0,0 +1,259 @@
+import io
+import os
+import glob
+import json
+import hashlib
+
+import pandas as pd
+
+from loguru import logger
+
+from src.utilities.schema import CATEGORICAL_COLUMNS, PIPELINE_COLUMNS, apply_schema
+
+# Keys of the monthly aggregates and the measures averaged by preprocess_df
+KEYS = ["Outlier", "Inv Date (MMM-YYYY)", "Material Code", "Storage Location Code"]
+FIRST_COLUMNS = ["Material Group Code", "Material Group Desc", "Material Desc"]
+MEASURES = {
+    "Total COGS EA": "AVG Total EA",
+    "Total COGS CTN": "AVG Total CTN",
+    "Total COGS Value": "AVG Total RM",
+}
+
+MANIFEST_NAME = "_manifest.json"
+
+# Invoice lines read at once by the chunked readers
+CHUNK_ROWS = 500000
+
+
+def partial_aggregate(df):
+    """
+    Mergeable monthly aggregates of raw invoice lines: per (outlier,
+    month, material, storage) the sum and the non-missing count of every
+    measure, and the first material descriptors. Partials of disjoint
+    rows are combined with merge_partials.
+
+    Parameters
+    ----------
+    df: DataFrame
+        Raw invoice lines with the PIPELINE_COLUMNS
+    """
+    df = df[PIPELINE_COLUMNS].copy()
+    df["Inv Date (MMM-YYYY)"] = df["Inv Date (MMM-YYYY)"].astype(str)
+
+    grouped = df.groupby(KEYS, sort=False, observed=True)
+    partial = grouped[FIRST_COLUMNS].first()
+    for measure in MEASURES:
+        partial[f"{measure} sum"] = grouped[measure].sum()
+        partial[f"{measure} count"] = grouped[measure].count()
+
+    return partial.reset_index()
+
+
+def merge_partials(partials):
+    """
+    Combine partial aggregates: sums and counts add up, descriptors keep
+    their first value in the order of `partials`.
+    """
+    partials = [partial for partial in partials if len(partial)]
+    if not partials:
+        return partial_aggregate(pd.DataFrame({column: [] for column in PIPELINE_COLUMNS}))
+    if len(partials) == 1:
+        return partials[0]
+
+    df = pd.concat(partials, ignore_index=True)
+    agg = {column: "first" for column in FIRST_COLUMNS}
+    agg.update({column: "sum" for column in df.columns if column.endswith((" sum", " count"))})
+
+    return df.groupby(KEYS, sort=False, observed=True).agg(agg).reset_index()
+
+
+def finalize(partial, outlier):
+    """
+    Turn merged partial aggregates into the frame preprocess_df returns
+    for `outlier`: one row per (month, material, storage) with the mean
+    of every measure, in the same row order and with the same dtypes.
+    Only the categories of the text columns may be listed in another
+    order.
+    """
+    df = partial[partial["Outlier"] == outlier]
+
+    df_grouped = df[["Inv Date (MMM-YYYY)", "Material Code", "Storage Location Code"] + FIRST_COLUMNS].copy()
+    for measure, name in MEASURES.items():
+        df_grouped[name] = df[f"{measure} sum"] / df[f"{measure} count"].where(df[f"{measure} count"] > 0)
+    df_grouped["Outlier"] = df["Outlier"]
+
+    # Text columns are categoricals in the store, whatever the partials were read as
+    for column in ["Inv Date (MMM-YYYY)"] + FIRST_COLUMNS:
+        if column in CATEGORICAL_COLUMNS:
+            df_grouped[column] = df_grouped[column].astype("category")
+
+    df_grouped["Date"] = pd.to_datetime(df_grouped["Inv Date (MMM-YYYY)"].astype(str), format="%b - %Y")
+    df_grouped = df_grouped.sort_values(["Date", "Material Code", "Storage Location Code"], kind="stable")
+    df_grouped.reset_index(drop=True, inplace=True)
+
+    return df_grouped
+
+
+def aggregate_csv(source, chunk_rows=CHUNK_ROWS):
+    """
+    Partial aggregates of a client CSV read `chunk_rows` invoice lines at
+    a time, so memory is bounded by the chunk and the number of series,
+    not by the size of the file.
+
+    Parameters
+    ----------
+    source: string or file-like
+        CSV to aggregate
+    chunk_rows: int, default = CHUNK_ROWS
+        Number of invoice lines read at once
+    """
+    partial = merge_partials([])
+    for chunk in pd.read_csv(source, usecols=PIPELINE_COLUMNS, chunksize=chunk_rows):
+        partial = merge_partials([partial, partial_aggregate(apply_schema(chunk))])
+    return partial
+
+
+def aggregate_client(source_dir, chunk_rows=CHUNK_ROWS):
+    """
+    Partial aggregates of every CSV in `source_dir`, each read in chunks
+    and merged in CSV name order. finalize() turns them into the exact
+    frame preprocess_df returns for the concatenated CSVs.
+    """
+    csv_files = sorted(glob.glob(os.path.join(source_dir, "*.csv")))
+    if not csv_files:
+        raise FileNotFoundError(f"No CSV files in {source_dir}")
+
+    partials = []
+    for csv_file in csv_files:
+        partials.append(aggregate_csv(csv_file, chunk_rows))
+        logger.info(f"Aggregated {os.path.basename(csv_file)}: {len(partials[-1])} monthly series rows")
+    return merge_partials(partials)
+
+
+def _sha1(path, size=None, block_size=1 << 20):
+    # Digest of the first `size` bytes of a file (all of it by default), read block by block
+    digest = hashlib.sha1()
+    remaining = os.path.getsize(path) if size is None else size
+    with open(path, "rb") as f:
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest.hexdigest()
+
+
+class AggregateState(object):
+    """
+    Monthly aggregates of a client persisted between runs, one partial
+    per source CSV under `state_dir`. On update, a CSV that only got new
+    lines appended has just those lines aggregated and merged into its
+    partial, a rewritten CSV is aggregated again and the partials of
+    removed CSVs are dropped. Nothing is written until save(). CSVs are
+    hashed and aggregated in chunks of `chunk_rows` lines.
+    """
+
+    def __init__(self, state_dir, chunk_rows=CHUNK_ROWS):
+        self.state_dir = str(state_dir)
+        self.chunk_rows = int(chunk_rows)
+        path = os.path.join(self.state_dir, MANIFEST_NAME)
+        if os.path.exists(path):
+            with open(path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {}
+        self.partials = {}
+        self.updated = set()
+
+    def _partial(self, csv_name):
+        if csv_name not in self.partials:
+            path = os.path.join(self.state_dir, os.path.splitext(csv_name)[0] + ".parquet")
+            self.partials[csv_name] = pd.read_parquet(path)
+        return self.partials[csv_name]
+
+    def update(self, source_dir):
+        """
+        Bring the aggregates up to date with the CSVs in `source_dir`.
+
+        Returns
+        -------
+        dict mapping every new or changed CSV name to "appended", "new"
+        or "rewritten", and removed ones to "removed"
+        """
+        csv_files = sorted(glob.glob(os.path.join(source_dir, "*.csv")))
+        csv_names = [os.path.basename(csv_file) for csv_file in csv_files]
+        changes = {}
+
+        for csv_name in list(self.manifest):
+            if csv_name not in csv_names:
+                del self.manifest[csv_name]
+                self.partials.pop(csv_name, None)
+                changes[csv_name] = "removed"
+
+        for csv_file, csv_name in zip(csv_files, csv_names):
+            entry = self.manifest.get(csv_name)
+            stat = os.stat(csv_file)
+            if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+                continue
+
+            digest = _sha1(csv_file)
+            if entry is not None and entry["sha1"] == digest:
+                entry["mtime"] = stat.st_mtime
+                continue
+
+            old_size = entry["size"] if entry is not None else 0
+            appended = False
+            if entry is not None and stat.st_size > old_size:
+                with open(csv_file, "rb") as f:
+                    f.seek(old_size - 1)
+                    appended = f.read(1) == b"\n" and _sha1(csv_file, old_size) == entry["sha1"]
+
+            if appended:
+                # Aggregate the new lines only, under the header of the file
+                with open(csv_file, "rb") as f:
+                    header = f.readline()
+                    f.seek(old_size)
+                    new_lines = io.BytesIO(header + f.read())
+                partial = merge_partials([self._partial(csv_name), aggregate_csv(new_lines, self.chunk_rows)])
+                changes[csv_name] = "appended"
+            else:
+                partial = aggregate_csv(csv_file, self.chunk_rows)
+                changes[csv_name] = "new" if entry is None else "rewritten"
+
+            logger.info(f"Aggregates of {csv_name}: {changes[csv_name]}")
+            self.partials[csv_name] = partial
+            self.updated.add(csv_name)
+            self.manifest[csv_name] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha1": digest}
+
+        return changes
+
+    def merged(self):
+        """
+        Aggregates of every CSV merged together, in CSV name order.
+        """
+        return merge_partials([self._partial(csv_name) for csv_name in sorted(self.manifest)])
+
+    def save(self):
+        """
+        Persist the updated partials and the manifest.
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+
+        for csv_name in self.updated:
+            partial = self.partials[csv_name]
+            path = os.path.join(self.state_dir, os.path.splitext(csv_name)[0] + ".parquet")
+            partial.to_parquet(path + ".tmp", index=False)
+            os.replace(path + ".tmp", path)
+
+        # Drop the partials of removed CSVs
+        stems = {os.path.splitext(csv_name)[0] for csv_name in self.manifest}
+        for path in glob.glob(os.path.join(self.state_dir, "*.parquet")):
+            if os.path.splitext(os.path.basename(path))[0] not in stems:
+                os.remove(path)
+
+        path = os.path.join(self.state_dir, MANIFEST_NAME)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(path + ".tmp", path)
+        self.updated = set()
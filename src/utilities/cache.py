@@ -0,0 +1,122 @@
+import os
+import pickle
+import hashlib
+
+import numpy as np
+
+from loguru import logger
+
+import src.utilities.utils as utils
+
+# Bump to invalidate every cached model when the fitting logic changes
+CACHE_VERSION = 3
+
+
+class ModelCache(object):
+    """
+    On-disk cache of fitted series, content-addressed by a hash of the
+    series values, the target column and the model configuration.
+    Each entry stores the chosen seasonal period, the fitted parameters
+    and the forecast. Entries are evicted least-recently-used first once
+    the cache grows over `max_size_mb`.
+    """
+
+    def __init__(self, cache_dir, max_size_mb=512):
+        self.cache_dir = str(cache_dir)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(df, column, engine="sarimax", shared_columns=()):
+        """
+        Hash a series and the model configuration used to fit it.
+
+        Parameters
+        ----------
+        df: DataFrame
+            Series to fit, one row per month
+        column: string
+            Column to forecast, could be AVG Total RM, EA / CTN
+        engine: string, default = "sarimax"
+            Forecasting engine, sarimax or ets
+        shared_columns: list of string, default = ()
+            Measures fitted before `column` whose seasonal period it
+            shares (multi-target runs), hashed along with the series
+        """
+        df = df.sort_values("Date")
+        values = df[[*shared_columns, column]].to_numpy(dtype=np.float64)
+        config = (
+            CACHE_VERSION,
+            engine,
+            column,
+            utils.SARIMAX_ORDER,
+            utils.SEASONAL_ORDER,
+            tuple(utils.SEASONAL_OPTIONS),
+            utils.FORECAST_STEPS,
+            utils.SEASONAL_ACF_MIN,
+        )
+        if shared_columns:
+            config += (tuple(shared_columns),)
+
+        digest = hashlib.sha1(repr(config).encode())
+        digest.update(values.tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".pkl")
+
+    def get(self, key):
+        """
+        Return the cached entry for `key`, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fp:
+                entry = pickle.load(fp)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+
+        # Refresh the access time used for eviction
+        os.utime(path)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        """
+        Store an entry, written to a temporary file first so a crashed
+        run never leaves a truncated entry behind.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as fp:
+            pickle.dump(entry, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def prune(self):
+        """
+        Evict the least recently used entries until the cache fits in
+        its size budget.
+        """
+        entries = []
+        for folder, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(folder, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            os.remove(path)
+            total_size -= size
+            evicted += 1
+
+        if evicted:
+            logger.info(f"Evicted {evicted} cached models, cache size is now {total_size / 1e6:.1f} MB")
@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-import src.utilities as utils
+from src.utilities.io_ import read_yaml
 
 
 # Paths
@@ -11,6 +11,8 @@ train_data_path = root_path / "data" / "training"
 morgan_train_data_path = root_path / "data" / "training" / "morgan"
 ferrero_train_data_path = root_path / "data" / "training" / "ferrero"
 predicted_data_path = root_path / "data" / "predicted"
+cache_data_path = root_path / "data" / "cache"
+store_data_path = root_path / "data" / "store"
 
 
 class ConfigManager(object):
@@ -22,4 +24,4 @@ class ConfigManager(object):
 
     def __init__(self, config_file="main_config.yaml"):
         # load main_config
-        self.params = utils.read_yaml(os.path.join(config_path, "main_config.yaml"))
\ No newline at end of file
+        self.params = read_yaml(os.path.join(config_path, config_file))
\ No newline at end of file
@@ -0,0 +1,18 @@
+# Model constants needed without the model code: building the task list
+# and keying the model cache must not import statsmodels. modeling and
+# utils re-export them.
+
+# SARIMAX orders and the seasonal periods tried by train_predict, in priority order
+SARIMAX_ORDER = (1, 1, 1)
+SEASONAL_ORDER = (1, 1, 1)
+SEASONAL_OPTIONS = [12, 8, 6, 4, 3, 2]
+
+# Number of months forecasted for every series
+FORECAST_STEPS = 24
+
+# Shortest series SARIMAX can be built on, a single observation fails with a 0-dimensional array
+MIN_OBSERVATIONS = 2
+
+# Autocorrelation of the differenced series at a seasonal lag below which
+# train_predict does not fit that period
+SEASONAL_ACF_MIN = 0.1
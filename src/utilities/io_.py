@@ -0,0 +1,91 @@
+import os
+import gzip
+import pickle
+import yaml
+
+
+def save(data, filename):
+    folders = os.path.dirname(filename)
+    if folders:
+        os.makedirs(folders, exist_ok=True)
+
+    fl = filename.lower()
+    if fl.endswith(".gz"):
+        if fl.endswith(".feather.gz") or fl.endswith(".fthr.gz"):
+            # Since feather doesn't support writing to the file handle, we
+            # can't easily point it to gzip.
+            raise NotImplementedError(
+                "Saving to compressed .feather not currently supported."
+            )
+        else:
+            fp = gzip.open(filename, "wb")
+            pickle.dump(data, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    else:
+        if fl.endswith(".feather") or fl.endswith(".fthr"):
+            if str(type(data)) != "<class 'pandas.core.frame.DataFrame'>":
+                raise TypeError(
+                    ".feather format can only be used to save pandas "
+                    "DataFrames"
+                )
+            # Write next to the target and swap it in, so readers never see a partial file
+            import feather
+
+            feather.write_dataframe(data, filename + ".tmp")
+            os.replace(filename + ".tmp", filename)
+        else:
+            fp = open(filename, "wb")
+            pickle.dump(data, fp, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load(filename):
+    """
+    Loads data saved with save() (or just normally saved with pickle).
+    Autodetects gzip if filename ends in '.gz'
+    Also reads feather files denoted .feather or .fthr.
+
+    Parameters
+    ----------
+    filename -- String with the relative filename of the pickle/feather
+    to load.
+    """
+    fl = filename.lower()
+    if fl.endswith(".gz"):
+        if fl.endswith(".feather.gz") or fl.endswith(".fthr.gz"):
+            raise NotImplementedError("Compressed feather is not supported.")
+        else:
+            fp = gzip.open(filename, "rb")
+            return pickle.load(fp)
+    else:
+        if fl.endswith(".feather") or fl.endswith(".fthr"):
+            import feather
+
+            return feather.read_dataframe(filename)
+        else:
+            fp = open(filename, "rb")
+            return pickle.load(fp)
+        
+
+def read_yaml(filename, render=False, **kwargs):
+    """
+    Read yaml configuation and returns the dict
+
+    Parameters
+    ----------
+    filename: string
+        Path including yaml file name
+    render: Boolean, default = False
+        Template rendering
+    **kwargs:
+        Template render args to be passed
+    """
+    if render:
+        from jinja2 import Template
+
+        yaml_text = Template(open(filename, "r").read())
+        yaml_text = yaml_text.render(**kwargs)
+        config = yaml.safe_load(yaml_text)
+    else:
+        with open(filename) as f:
+            config = yaml.safe_load(f)
+
+    return config
@@ -0,0 +1,635 @@
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from itertools import product
+from loguru import logger
+from statsmodels.tsa.statespace.sarimax import SARIMAX
+from src.utilities.timeouts import FitTimeout, time_limit
+from src.utilities.constants import (
+    SARIMAX_ORDER, SEASONAL_ORDER, SEASONAL_OPTIONS, FORECAST_STEPS, MIN_OBSERVATIONS, SEASONAL_ACF_MIN,
+)
+
+# Smoothing parameter grid searched by batch_train_predict (alpha, beta, gamma)
+ETS_GRID = np.array([
+    (alpha, beta, gamma)
+    for alpha, beta, gamma in product(
+        [0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 0.9],
+        [0.0, 0.01, 0.05, 0.1],
+        [0.0, 0.05, 0.1, 0.3],
+    )
+    if beta <= alpha and gamma <= 1 - alpha
+])
+ETS_DAMPING = 0.98
+
+# Average demand interval above which a series is intermittent (Syntetos-Boylan cut-off)
+INTERMITTENT_ADI = 1.32
+
+# Smoothing of the demand size and demand probability of the TSB method
+TSB_ALPHA = 0.1
+TSB_BETA = 0.1
+
+def sarimax_forecast(series, seasonal_period, params=None, start_params=None):
+    """
+    Fit (or filter) one SARIMAX model and forecast FORECAST_STEPS months,
+    negative values clipped to 0.
+
+    Parameters
+    ----------
+    series: Series
+        Observations sorted by date
+    seasonal_period: int
+        Seasonal period of the model
+    params: array, default = None
+        Known parameters, the model is only filtered with them and no
+        estimation is done
+    start_params: array, default = None
+        Starting values for the optimizer
+
+    Returns
+    -------
+    (forecast, model_fit, iterations): iterations is the optimizer
+    iteration count, 0 when `params` is given
+    """
+    model = SARIMAX(series, 
+                    order=SARIMAX_ORDER,       
+                    seasonal_order=SEASONAL_ORDER + (seasonal_period,),  
+                    enforce_stationarity=False,
+                    enforce_invertibility=False)
+
+    if params is not None:
+        model_fit = model.filter(params)
+        iterations = 0
+    else:
+        model_fit = model.fit(start_params=start_params, disp=False)
+        iterations = (model_fit.mle_retvals or {}).get("iterations")
+
+    # Forecast next 24 months
+    forecast = model_fit.forecast(steps=FORECAST_STEPS)
+
+    # Replace negative values with 0
+    forecast[forecast < 0] = 0
+
+    return forecast, model_fit, iterations
+
+def fit_candidate(series, seasonal_period, timeout=None):
+    """
+    Fit one seasonal period candidate. Errors are returned instead of
+    raised so candidates can run on an executor. A fit still running
+    after `timeout` seconds is stopped and returned as an error, so a
+    candidate on an executor never outlives the series fit.
+
+    Returns
+    -------
+    (forecast, params, iterations, seconds, error): seconds is the
+    wall-clock time of the fit
+    """
+    start = time.perf_counter()
+    try:
+        with time_limit(timeout):
+            forecast, model_fit, iterations = sarimax_forecast(series, seasonal_period)
+        return forecast, np.asarray(model_fit.params), iterations, time.perf_counter() - start, None
+    except FitTimeout as e:
+        # Without a timeout of its own the alarm is the caller's and stops the whole series
+        if timeout is None:
+            raise
+        return None, None, 0, time.perf_counter() - start, str(e)
+    except Exception as e:
+        return None, None, 0, time.perf_counter() - start, str(e)
+
+def seasonal_autocorrelation(values, lag):
+    """
+    Autocorrelation at `lag` of the first differences of a series, over
+    the pairs of months both observed. NaN when the differences do not
+    cover two seasons or do not vary.
+    """
+    diffs = np.diff(np.asarray(values, dtype=np.float64))
+    if len(diffs) < 2 * lag:
+        return np.nan
+
+    x, y = diffs[:-lag], diffs[lag:]
+    pairs = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[pairs] - x[pairs].mean(), y[pairs] - y[pairs].mean()
+    scale = np.sqrt((x ** 2).sum() * (y ** 2).sum())
+    return (x * y).sum() / scale if scale > 0 else np.nan
+
+def screen_seasonal_periods(values, seasonal_options=None):
+    """
+    Cheap screening of the seasonal periods a series can support, so
+    train_predict does not pay for fits that cannot work.
+
+    A period is skipped when regular and seasonal differencing leave
+    exactly one observation: the likelihood cannot be estimated from a
+    single differenced point and the fit always fails or explodes. With
+    no observation left the model stays on its diffuse prior, which
+    still gives a usable forecast for short series, so those are kept.
+
+    A period is also skipped when the series shows no seasonality at
+    it: the autocorrelation of its differences at that lag is below
+    SEASONAL_ACF_MIN. Series too short to measure it keep the period.
+    If no period shows seasonality, the first one is kept so the series
+    still gets a fit.
+
+    Parameters
+    ----------
+    values: array
+        Observations sorted by date
+    seasonal_options: list of int, default = None
+        Periods in priority order, defaults to SEASONAL_OPTIONS
+
+    Returns
+    -------
+    (candidates, screened_out): lists of seasonal periods in priority order
+    """
+    if seasonal_options is None:
+        seasonal_options = SEASONAL_OPTIONS
+
+    d, D = SARIMAX_ORDER[1], SEASONAL_ORDER[1]
+
+    candidates, weak, screened_out = [], [], []
+    for s in seasonal_options:
+        if len(values) - d - D * s == 1:
+            screened_out.append(s)
+        elif seasonal_autocorrelation(values, s) < SEASONAL_ACF_MIN:
+            weak.append(s)
+        else:
+            candidates.append(s)
+
+    if not candidates and weak:
+        candidates.append(weak.pop(0))
+    screened_out = [s for s in seasonal_options if s in screened_out or s in weak]
+
+    return candidates, screened_out
+
+def train_predict(df, column, return_info=False, warm_start=None, executor=None, preferred_period=None, timeout=None):
+    """
+    Fit SARIMAX over the screened seasonal periods and forecast with the
+    first model that does not explode.
+
+    Parameters
+    ----------
+    df: DataFrame
+        Series to fit, one row per month
+    column: string
+        Column to forecast, could be AVG Total RM, EA / CTN
+    return_info: Boolean, default = False
+        Also return a dict with the chosen `seasonal_period`, the fitted
+        `params`, the `engine`, the `fit_mode` (cold, warm or extend), the total
+        optimizer `iterations`, the number of fits `n_fits`, the
+        periods `screened_out`, the wall-clock `seconds` and the
+        `attempts`, one dict per fit with its seasonal period, fit mode,
+        seconds, iterations and status (ok, exploded or failed)
+    warm_start: dict, default = None
+        Previous fit of the same series with its `values`,
+        `seasonal_period` and `params`. If the series only got new
+        months the previous params are reused without re-estimation,
+        otherwise they seed the optimizer. Falls back to the full search
+        if the result explodes.
+    executor: Executor, default = None
+        If given, all candidate periods are fitted on it in parallel and
+        the first stable one in priority order is kept
+    preferred_period: int, default = None
+        Seasonal period chosen for another measure of the same series,
+        tried first on its own. The other periods are only fitted, in
+        priority order, if it fails or explodes.
+    timeout: float, default = None
+        Seconds the candidates fitted on `executor` may run, they are
+        stopped in the workers once it is spent. The caller bounds the
+        fit itself, see pipeline.fit_series.
+    """
+    info = {
+        "seasonal_period": None,
+        "params": None,
+        "engine": "sarimax",
+        "fit_mode": "cold",
+        "iterations": 0,
+        "n_fits": 0,
+        "screened_out": [],
+        "seconds": 0.0,
+        "attempts": [],
+    }
+    start = time.perf_counter()
+
+    # Suppress warnings
+    warnings.filterwarnings("ignore")
+
+    # Sort values to ensure correct order
+    df_base_sample = df.sort_values("Date").reset_index(drop=True)
+    series = df_base_sample[column]
+
+    if warm_start is not None and warm_start["seasonal_period"] is not None:
+        seasonal_period = warm_start["seasonal_period"]
+        previous = warm_start["values"]
+        extended = (
+            len(series) >= len(previous)
+            and np.array_equal(series.values[:len(previous)], previous)
+        )
+
+        fit_mode = "extend" if extended else "warm"
+        attempt = {"seasonal_period": seasonal_period, "fit_mode": fit_mode, "iterations": 0}
+        info["attempts"].append(attempt)
+        fit_start = time.perf_counter()
+
+        try:
+            info["n_fits"] += 1
+            if extended:
+                # Only new months were appended, extend the state with the known params
+                forecast, model_fit, iterations = sarimax_forecast(
+                    series, seasonal_period, params=warm_start["params"]
+                )
+            else:
+                forecast, model_fit, iterations = sarimax_forecast(
+                    series, seasonal_period, start_params=warm_start["params"]
+                )
+            info["iterations"] += iterations or 0
+            attempt["iterations"] = iterations or 0
+            attempt["seconds"] = time.perf_counter() - fit_start
+
+            if not (forecast.abs().max() > 3 * series.max()):
+                attempt["status"] = "ok"
+                info.update({
+                    "seasonal_period": seasonal_period,
+                    "params": np.asarray(model_fit.params),
+                    "fit_mode": fit_mode,
+                    "seconds": time.perf_counter() - start,
+                })
+                return (forecast, info) if return_info else forecast
+            attempt["status"] = "exploded"
+
+        except Exception as e:
+            attempt.update({"seconds": time.perf_counter() - fit_start, "status": "failed"})
+            logger.info(f"Warm start failed with seasonal order {seasonal_period}: {e}")
+
+    # Skip the seasonal periods the series cannot support
+    seasonal_options = SEASONAL_OPTIONS
+    if preferred_period in SEASONAL_OPTIONS:
+        seasonal_options = [preferred_period] + [s for s in SEASONAL_OPTIONS if s != preferred_period]
+    candidates, info["screened_out"] = screen_seasonal_periods(series.values, seasonal_options)
+
+    # A preferred period usually fits, so the candidates run one by one rather than all at once
+    futures = []
+    if executor is None or candidates[:1] == [preferred_period]:
+        results = ((s, fit_candidate(series, s)) for s in candidates)
+    else:
+        futures = [(s, executor.submit(fit_candidate, series, s, timeout)) for s in candidates]
+        results = ((s, future.result()) for s, future in futures)
+
+    # The candidates still queued are dropped once one is kept, or when the series runs out of time
+    try:
+        for seasonal_period, (forecast, params, iterations, seconds, error) in results:
+            info["n_fits"] += 1
+            info["iterations"] += iterations or 0
+            attempt = {
+                "seasonal_period": seasonal_period,
+                "fit_mode": "cold",
+                "seconds": seconds,
+                "iterations": iterations or 0,
+            }
+            info["attempts"].append(attempt)
+
+            if error is not None:
+                attempt["status"] = "failed"
+                logger.info(f"Model failed with seasonal order {seasonal_period}: {error}")
+                continue
+
+            # Explosion check: If the forecast exceeds 3 * max actual value, it's unstable
+            if (forecast.abs().max() > 3 * series.max()):
+                attempt["status"] = "exploded"
+                # print(f"⚠️ Forecast exploded with seasonal order {seasonal_period}, trying next...")
+                continue
+
+            attempt["status"] = "ok"
+
+            # print(f"Model trained successfully with seasonal order {seasonal_period}")
+            info.update({"seasonal_period": seasonal_period, "params": params, "seconds": time.perf_counter() - start})
+            return (forecast, info) if return_info else forecast  # Return forecast if successful
+    finally:
+        for _, future in futures:
+            future.cancel()
+
+    info["seconds"] = time.perf_counter() - start
+    logger.info("No valid SARIMAX model could be trained. Consider removing seasonality.")
+    return (None, info) if return_info else None  # Return None if all attempts fail
+
+def batch_train_predict(values, seasonal_options=None, chunk_size=2048):
+    """
+    Vectorized alternative to train_predict for many short series of the
+    same length: additive damped-trend Holt-Winters, with the smoothing
+    parameters picked per series from ETS_GRID by in-sample one-step SSE.
+    All series and all grid points are filtered at once with NumPy.
+
+    The seasonal period is the first of `seasonal_options` with two full
+    seasons of history. Forecasts are clipped at 0 and go through the
+    same explosion check as train_predict, series failing it or with a
+    missing value are flagged so the caller can fall back to SARIMAX.
+
+    Parameters
+    ----------
+    values: 2D array
+        One series per row, sorted by date, all of the same length
+    seasonal_options: list of int, default = None
+        Periods in priority order, defaults to SEASONAL_OPTIONS
+    chunk_size: int, default = 2048
+        Number of series filtered together, bounds the memory used
+
+    Returns
+    -------
+    (forecasts, valid, seasonal_period, params): forecasts has one row of
+    FORECAST_STEPS values per series, valid flags the stable ones and
+    params holds the chosen (alpha, beta, gamma) per series. Returns
+    None if the series are too short for any seasonal period.
+    """
+    if seasonal_options is None:
+        seasonal_options = SEASONAL_OPTIONS
+
+    values = np.asarray(values, dtype=np.float64)
+    n_series, n = values.shape
+    m = next((s for s in seasonal_options if n >= 2 * s), None)
+    if m is None:
+        return None
+
+    forecasts = np.empty((n_series, FORECAST_STEPS))
+    params = np.empty((n_series, 3))
+    alpha, beta, gamma = (ETS_GRID[:, i][:, None] for i in range(3))
+    phi = ETS_DAMPING
+
+    # Damped trend multiplier of every forecast step: phi + phi^2 + ... + phi^h
+    damped_steps = np.cumsum(phi ** np.arange(1, FORECAST_STEPS + 1))
+
+    for start in range(0, n_series, chunk_size):
+        y = values[start:start + chunk_size]
+        k = len(y)
+
+        # Initial states from the first two seasons
+        level = np.broadcast_to(y[:, :m].mean(axis=1), (len(ETS_GRID), k)).copy()
+        trend = np.broadcast_to((y[:, m:2 * m].mean(axis=1) - y[:, :m].mean(axis=1)) / m, (len(ETS_GRID), k)).copy()
+        season = np.broadcast_to(y[:, :m] - y[:, :m].mean(axis=1, keepdims=True), (len(ETS_GRID), k, m)).copy()
+        sse = np.zeros((len(ETS_GRID), k))
+
+        # Error-correction form of the recursions, for every grid point at once
+        for t in range(n):
+            i = t % m
+            error = y[:, t] - (level + phi * trend + season[:, :, i])
+            sse += error ** 2
+            level = level + phi * trend + alpha * error
+            trend = phi * trend + beta * error
+            season[:, :, i] += gamma * error
+
+        best = np.argmin(sse, axis=0)
+        cols = np.arange(k)
+        steps = (n + np.arange(FORECAST_STEPS)) % m
+        forecasts[start:start + k] = (
+            level[best, cols][:, None]
+            + damped_steps[None, :] * trend[best, cols][:, None]
+            + season[best, cols][:, steps]
+        )
+        params[start:start + k] = ETS_GRID[best]
+
+    # Replace negative values with 0
+    forecasts[forecasts < 0] = 0
+
+    # Explosion check: If the forecast exceeds 3 * max actual value, it's unstable.
+    # Series with a missing month are never valid, SARIMAX handles the gap
+    valid = (
+        np.isfinite(values).all(axis=1)
+        & np.isfinite(forecasts).all(axis=1)
+        & (np.abs(forecasts).max(axis=1) <= 3 * values.max(axis=1))
+    )
+
+    return forecasts, valid, m, params
+
+def min_series_length(seasonal_period=None):
+    """
+    Minimum number of observations a series needs for the seasonal model,
+    i.e. at least one observation left after regular and seasonal differencing.
+
+    Parameters
+    ----------
+    seasonal_period: int, default = None
+        Seasonal period to check, defaults to the smallest in SEASONAL_OPTIONS
+    """
+    if seasonal_period is None:
+        seasonal_period = min(SEASONAL_OPTIONS)
+
+    return SARIMAX_ORDER[1] + SEASONAL_ORDER[1] * seasonal_period + 1
+
+def classify_series(values):
+    """
+    Route a series to the cheapest method that suits it, so SARIMAX only
+    sees series it can fit.
+
+    Parameters
+    ----------
+    values: array
+        Observations sorted by date
+
+    Returns
+    -------
+    string: "zero" if every observation is 0 or missing, "constant" if
+    they all have the same value, "short" if the series is shorter than
+    min_series_length(), "intermittent" if its average demand interval
+    exceeds INTERMITTENT_ADI and "sarimax" otherwise. The interval is
+    measured over the observed months only: the measures are monthly
+    means, so a month without invoices has no mean rather than a zero
+    one, and only zero-valued observations count as months without
+    demand.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    present = values[~np.isnan(values)]
+
+    if not np.any(present):
+        return "zero"
+    if np.ptp(present) == 0:
+        return "constant"
+    if len(values) < min_series_length():
+        return "short"
+    if len(values) / np.count_nonzero(present) > INTERMITTENT_ADI:
+        return "intermittent"
+    return "sarimax"
+
+def seasonal_naive_forecast(values, seasonal_options=None):
+    """
+    Repeat the last season of a series over FORECAST_STEPS months. The
+    season is the first of `seasonal_options` the series covers, a series
+    shorter than all of them repeats its last value. Missing
+    observations count as the series mean.
+
+    Returns
+    -------
+    (forecast, seasonal_period): seasonal_period is None without a season
+    """
+    if seasonal_options is None:
+        seasonal_options = SEASONAL_OPTIONS
+
+    values = np.asarray(values, dtype=np.float64)
+    values = np.where(np.isnan(values), np.nanmean(values), values)
+    seasonal_period = next((s for s in seasonal_options if len(values) >= s), None)
+
+    forecast = np.resize(values[-(seasonal_period or 1):], FORECAST_STEPS)
+    forecast[forecast < 0] = 0
+
+    return forecast, seasonal_period
+
+def tsb_forecast(values, alpha=TSB_ALPHA, beta=TSB_BETA):
+    """
+    Teunter-Syntetos-Babai forecast of an intermittent series: the
+    smoothed demand size times the smoothed probability of a non-zero
+    month, flat over FORECAST_STEPS months. Unlike Croston the
+    probability also decays through runs of zeros, so a series that
+    stopped selling fades out.
+
+    Parameters
+    ----------
+    values: array
+        Observations sorted by date, with at least one non-zero value
+    alpha: float, default = TSB_ALPHA
+        Smoothing of the demand size
+    beta: float, default = TSB_BETA
+        Smoothing of the demand probability
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    demand = values != 0
+
+    # Start from the averages of the whole series
+    size = values[demand].mean()
+    probability = demand.mean()
+    for value, is_demand in zip(values, demand):
+        probability += beta * (is_demand - probability)
+        if is_demand:
+            size += alpha * (value - size)
+
+    forecast = np.full(FORECAST_STEPS, max(size * probability, 0.0))
+
+    return forecast
+
+def fast_forecast(values, method):
+    """
+    Forecast a series routed by classify_series to a method other than
+    SARIMAX.
+
+    Returns
+    -------
+    (forecast, seasonal_period): seasonal_period is only set by the
+    seasonal naive forecast of short series
+    """
+    values = np.asarray(values, dtype=np.float64)
+
+    if method == "zero":
+        return np.zeros(FORECAST_STEPS), None
+    if method == "constant":
+        return np.full(FORECAST_STEPS, max(np.nanmax(values), 0.0)), None
+    if method == "short":
+        return seasonal_naive_forecast(values)
+    if method == "intermittent":
+        return tsb_forecast(values), None
+    raise ValueError(f"No fast forecast for method {method}")
+
+def rolling_forecasts(values, seasonal_period, params, first_origin, horizon):
+    """
+    Forecasts of `horizon` months from every origin between
+    `first_origin` and the end of `values`, all with the same params:
+    the model is filtered on the months before the first origin and its
+    state is then extended one month at a time, without re-estimation.
+
+    Parameters
+    ----------
+    values: array
+        Observations sorted by date
+    seasonal_period: int
+        Seasonal period of the model
+    params: array
+        Parameters fitted on values[:first_origin]
+    first_origin: int
+        Number of months known at the first origin
+    horizon: int
+        Months forecasted from every origin
+
+    Returns
+    -------
+    2D array of one row per origin and one column per horizon month,
+    negative values clipped to 0
+    """
+    values = np.asarray(values, dtype=np.float64)
+    model = SARIMAX(values[:first_origin],
+                    order=SARIMAX_ORDER,
+                    seasonal_order=SEASONAL_ORDER + (seasonal_period,),
+                    enforce_stationarity=False,
+                    enforce_invertibility=False)
+    model_fit = model.filter(params)
+
+    forecasts = np.empty((len(values) - first_origin, horizon))
+    for i, origin in enumerate(range(first_origin, len(values))):
+        if origin > first_origin:
+            # Append the month that became known, the state is updated from where it was
+            model_fit = model_fit.extend(values[origin - 1:origin])
+        forecasts[i] = model_fit.forecast(steps=horizon)
+
+    forecasts[forecasts < 0] = 0
+    return forecasts
+
+def rolling_fast_forecasts(values, method, first_origin, horizon):
+    """
+    Forecasts of `horizon` months from every origin between
+    `first_origin` and the end of `values` with a cheap method of
+    fast_forecast, see rolling_forecasts. These methods have nothing to
+    fit, so each origin forecasts from scratch.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    return np.vstack([
+        fast_forecast(values[:origin], method)[0][:horizon] for origin in range(first_origin, len(values))
+    ])
+
+def forecast_accuracy(values, forecasts, first_origin):
+    """
+    Errors of rolling-origin forecasts against the observations. Months
+    past the end of `values` or missing are left out.
+
+    Parameters
+    ----------
+    values: array
+        Observations sorted by date
+    forecasts: 2D array
+        Output of rolling_forecasts for the same `first_origin`
+
+    Returns
+    -------
+    dict with the `mape`, mean absolute percentage error over the
+    non-zero observations, the `wape`, absolute errors summed over the
+    observations summed, the number of forecasted months compared
+    `points` and the sum of their observations `actual`, which weighs
+    the WAPE of several series. Errors are NaN when undefined.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    months = np.arange(first_origin, len(values))[:, None] + np.arange(forecasts.shape[1])
+    actuals = np.where(months < len(values), values[np.minimum(months, len(values) - 1)], np.nan)
+
+    valid = ~np.isnan(actuals) & ~np.isnan(forecasts)
+    errors = np.abs(forecasts - actuals)[valid]
+    actuals = np.abs(actuals[valid])
+
+    total = actuals.sum()
+    wape = errors.sum() / total if total > 0 else np.nan
+    nonzero = actuals > 0
+    mape = np.mean(errors[nonzero] / actuals[nonzero]) if nonzero.any() else np.nan
+    return {"mape": mape, "wape": wape, "points": int(valid.sum()), "actual": total}
+
+def postprocess(df_base_sample, forecast, column, plot):
+    # Column could be AVG Total RM, EA / CTN
+    # Get the last date in the dataset
+    last_date = df_base_sample['Date'].max()
+
+    # Generate future dates for the next 12 months, keeping the day as 1
+    future_dates = pd.date_range(start=last_date + pd.DateOffset(months=1),  # Start from next month
+                                periods=FORECAST_STEPS,  # Generate 24 months
+                                freq='MS')   # 'MS' ensures the 1st day of each month
+
+
+    if plot:
+        from src.utilities.plotting import plot_forecast
+
+        plot_forecast(df_base_sample, future_dates, forecast, column)
+
+    return future_dates
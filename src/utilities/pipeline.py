@@ -0,0 +1,828 @@
+import os
+import sys
+import time
+import hashlib
+import importlib
+
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from loguru import logger
+
+import src.utilities.utils as utils
+from src.utilities.timeouts import FitTimeout, time_limit
+
+# Hyperparameters :)
+COLUMNS = ["AVG Total RM", "AVG Total EA", "AVG Total CTN"]
+STORAGE_TYPES = ["All", "Specific"]
+OUTLIERS = [True, False]
+
+# COGS Type of the forecast output for every target column
+COGS_TYPES = {"AVG Total RM": "RM", "AVG Total EA": "EA", "AVG Total CTN": "CTN"}
+
+# Task entries holding a forecast obtained without fitting the series
+PRECOMPUTED = ("cached", "batched", "reconciled", "fast_path")
+
+# Method of the forecast output for every class of utils.classify_series routed off SARIMAX
+FAST_PATH_METHODS = {"zero": "zero", "constant": "constant", "short": "seasonal_naive", "intermittent": "tsb"}
+
+
+def configure_logger(log_file):
+    """
+    Route loguru output to the run log file and stderr.
+
+    Parameters
+    ----------
+    log_file: string
+        Path of the run log file
+    """
+    logger.remove()
+    logger.add(
+        log_file,
+        format="<green>{time}</green> | <yellow>{name}</yellow> | {level} |"
+        " <cyan>{message}</cyan>"
+    )
+    logger.add(
+        sys.stderr,
+        colorize=True,
+        format="<green>{time}</green> | <yellow>{name}</yellow> | {level} |"
+        " <cyan>{message}</cyan>"
+    )
+
+
+def build_tasks(df, sample=False, keep_short=False):
+    """
+    Aggregate the raw data and enumerate every series to fit, one task
+    per (column, storage type, outlier, material, storage), in a fixed
+    order.
+
+    Parameters
+    ----------
+    df: DataFrame
+        Raw training data
+    sample: Boolean, default = False
+        Keep only the first 10 series of every combination
+    keep_short: Boolean, default = False
+        Keep the single-observation series SARIMAX cannot fit, for
+        route_series to forecast them with a seasonal naive method
+    """
+    # Aggregate and partition the data once per OUTLIER setting, shared by every COLUMN
+    partitions = {outlier: utils.build_partitions(df, outlier) for outlier in OUTLIERS}
+
+    return enumerate_tasks(partitions, sample, keep_short)
+
+
+def enumerate_tasks(partitions, sample=False, keep_short=False):
+    """
+    Enumerate the series of partitioned aggregates, see build_tasks.
+
+    Parameters
+    ----------
+    partitions: dict
+        Outlier setting mapped to the output of utils.build_partitions
+    sample: Boolean, default = False
+        Keep only the first 10 series of every combination
+    keep_short: Boolean, default = False
+        Keep the single-observation series SARIMAX cannot fit
+    """
+    # Collect every series to fit, in a fixed order
+    tasks = []
+
+    # Series are enumerated from the observed (material, storage) pairs only
+    for outlier, partition in partitions.items():
+        df_grouped, series_index = partition["Specific"]
+        n_combinations = df_grouped["Material Code"].nunique() * df_grouped["Storage Location Code"].nunique()
+        logger.info(
+            f"OUTLIER={outlier}: {len(series_index)} observed material-storage pairs "
+            f"out of {n_combinations} combinations"
+        )
+
+    # Series shorter than this cannot be fitted at all, shorter ones still get a forecast from the diffuse prior
+    min_length = 1 if keep_short else utils.MIN_OBSERVATIONS
+
+    # Iterate over all parameter combinations
+    combinations = list(product(COLUMNS, STORAGE_TYPES, OUTLIERS))
+    n_dropped = 0
+    for col, storage_type, outlier in combinations:
+        # Storage type "All" is keyed by (material, None)
+        df_grouped, series_index = partitions[outlier][storage_type]
+
+        # Drop series too short to fit before any model is built
+        series_pairs = [
+            (key, rows) for key, rows in series_index.items()
+            if rows.stop - rows.start >= min_length
+        ]
+        n_dropped += len(series_index) - len(series_pairs)
+
+        # Iterate over material-storage pairs
+        for i, ((material, storage), rows) in enumerate(series_pairs):
+            if sample:
+                if i >= 10: 
+                    break  # Stop early if sample = True
+
+            # Zero-copy slice of the series rows
+            df_sample = df_grouped.iloc[rows]
+
+            tasks.append({
+                "df": df_sample,
+                "column": col,
+                "outlier": outlier,
+                "material": material,
+                "storage": storage,
+            })
+
+    logger.info(
+        f"Enumerated {len(tasks)} series over {len(combinations)} column/storage type/outlier combinations"
+        + (", at most 10 per combination" if sample else "")
+        + (f", dropped {n_dropped} shorter than {min_length} observations" if n_dropped else "")
+    )
+    return tasks
+
+
+def fit_limit(task):
+    """
+    Seconds a task may spend fitting: its `timeout`, capped by the time
+    left before its `deadline` (epoch seconds). None without either.
+    """
+    limits = []
+    if task.get("timeout"):
+        limits.append(task["timeout"])
+    if task.get("deadline") is not None:
+        limits.append(task["deadline"] - time.time())
+    return min(limits) if limits else None
+
+
+def fallback_forecast(task, reason, seconds=0.0):
+    """
+    Seasonal naive forecast of a task whose fit timed out ("timeout") or
+    was skipped because the run budget is spent ("budget"), with its
+    fit info flagged as a `fallback`.
+    """
+    values = task["df"].sort_values("Date")[task["column"]].to_numpy(dtype=np.float64)
+    forecast, seasonal_period = utils.seasonal_naive_forecast(values)
+    # The interrupted fit counts as one rejected attempt in the run profile
+    attempts = [{"seasonal_period": None, "iterations": 0, "seconds": seconds, "status": reason}] if seconds else []
+    info = {
+        "seasonal_period": seasonal_period,
+        "params": None,
+        "engine": "seasonal_naive",
+        "fit_mode": reason,
+        "iterations": 0,
+        "n_fits": 0,
+        "screened_out": [],
+        "seconds": seconds,
+        "attempts": attempts,
+        "fallback": True,
+        "forecast": forecast,
+    }
+    return forecast, info
+
+
+def series_value(task):
+    """
+    Importance of the series of a task: its total monthly RM COGS value,
+    the same for the three measures of the series.
+    """
+    return float(np.nansum(task["df"]["AVG Total RM"].to_numpy(dtype=np.float64)))
+
+
+def prioritize(tasks):
+    """
+    Sort tasks by decreasing series_value, so a run short on time fits
+    the most valuable series first. The sort is stable, so the measures
+    of a series ordered by order_by_series stay adjacent.
+    """
+    return sorted(tasks, key=series_value, reverse=True)
+
+
+def precomputed(task):
+    """
+    Forecast entry of a task that needs no fit: from the model cache,
+    the batched engine, a bottom-up reconciliation or the fast path of
+    degenerate series. None otherwise.
+    """
+    return next((task[key] for key in PRECOMPUTED if task.get(key) is not None), None)
+
+
+def fit_series(task, executor=None):
+    """
+    Train and forecast a single series and build its result columns.
+    Errors are captured and returned so one bad series never stops a run.
+
+    Parameters
+    ----------
+    task: dict
+        Series to fit with keys `df`, `column`, `outlier`, `material`
+        and `storage` (None for the "All" storage type). An optional
+        `cached` entry from the model cache, `batched` entry from
+        batch_forecast, `reconciled` entry from reconcile_bottom_up or
+        `fast_path` entry from route_series skips the training, an
+        optional `warm_start` entry seeds it with the previous run's fit
+        and an optional `preferred_period` is the seasonal period tried
+        first. Optional `timeout` (seconds) and `deadline` (epoch
+        seconds) entries bound the fit, see fit_limit, a series out of
+        time gets a fallback_forecast.
+    executor: Executor, default = None
+        Executor to fit the seasonal period candidates on in parallel
+
+    Returns
+    -------
+    (result, info, error): the forecast columns as accepted by
+    ResultWriter.append, the fit info (seasonal period, params and
+    forecast) and the error message, if any
+    """
+    df_sample = task["df"]
+    col = task["column"]
+    info = None
+
+    try:
+        if precomputed(task) is not None:
+            # Reuse the forecast of an identical series, of the batched engine, of the storage level or of a cheap method
+            info = precomputed(task)
+            forecast = info["forecast"]
+        else:
+            limit = fit_limit(task)
+            start = time.perf_counter()
+            if limit is not None and limit <= 0:
+                # The run budget is spent, degrade to the cheap method without fitting
+                forecast, info = fallback_forecast(task, "budget")
+            else:
+                try:
+                    # Train and forecast
+                    with time_limit(limit):
+                        forecast, info = utils.train_predict(
+                            df_sample, col, return_info=True, warm_start=task.get("warm_start"), executor=executor,
+                            preferred_period=task.get("preferred_period"), timeout=limit,
+                        )
+                    info["forecast"] = None if forecast is None else np.asarray(forecast)
+                except FitTimeout:
+                    over_budget = task.get("deadline") is not None and time.time() >= task["deadline"]
+                    forecast, info = fallback_forecast(
+                        task, "budget" if over_budget else "timeout", time.perf_counter() - start
+                    )
+
+        # A series no model could be trained on is reported and left out of the output
+        if forecast is None:
+            return None, info, "No valid SARIMAX model could be trained"
+
+        # Post-process results
+        future_dates = utils.postprocess(df_sample, forecast, col, False)
+
+        # Determine COGS Type
+        cogs_type = COGS_TYPES[col]
+        material_group_code = df_sample["Material Group Code"].values[0]
+        material_group_desc = df_sample["Material Group Desc"].values[0]
+        material_desc = df_sample["Material Desc"].values[0]
+
+        result = {
+            "Date": future_dates.values,
+            "material_group_code" : material_group_code,
+            "material_group_desc" : material_group_desc,
+            "material_desc" : material_desc,
+            "Material Code": task["material"],
+            "Storage Location Code": str(task["storage"]) if task["storage"] else "All",
+            "COGS Type": cogs_type,
+            "COGS Value": np.asarray(forecast, dtype=np.float64),
+            "Outlier": task["outlier"],
+            "Method": info.get("engine"),
+            "Fallback": bool(info.get("fallback", False)),
+        }
+        return result, info, None
+
+    except Exception as error:
+        return None, info, str(error)
+
+
+def series_id(task):
+    """
+    Series of a task whatever its measure: (outlier, material, storage).
+    """
+    return (task["outlier"], task["material"], task["storage"])
+
+
+def order_by_series(tasks):
+    """
+    Reorder tasks so the measures of every series are adjacent, in
+    COLUMNS order, series keeping the order of their first task. This is
+    the order run_series expects with `multi_target`.
+    """
+    first = {}
+    for i, task in enumerate(tasks):
+        first.setdefault(series_id(task), i)
+    return sorted(tasks, key=lambda task: (first[series_id(task)], COLUMNS.index(task["column"])))
+
+
+def fit_targets(tasks, executor=None):
+    """
+    Fit the measures of one series in turn, sharing the model selection:
+    the seasonal period SARIMAX picks for the first measure is tried
+    first for the others, which then usually need a single fit.
+
+    Parameters
+    ----------
+    tasks: list of dict
+        Tasks of one series, one per measure, as accepted by fit_series
+    executor: Executor, default = None
+        Executor to fit the seasonal period candidates on in parallel
+
+    Returns
+    -------
+    list of the fit_series output of every task, in order
+    """
+    outputs = []
+    preferred_period = None
+    for task in tasks:
+        if preferred_period is not None and precomputed(task) is None:
+            task = {**task, "preferred_period": preferred_period}
+        output = fit_series(task, executor)
+
+        info = output[1]
+        if preferred_period is None and info is not None and info.get("engine") == "sarimax":
+            preferred_period = info["seasonal_period"]
+        outputs.append(output)
+
+    return outputs
+
+
+def result_key(task):
+    """
+    Key of a series in the forecast output:
+    (COGS Type, Outlier, Material Code, Storage Location Code).
+    """
+    storage = str(task["storage"]) if task["storage"] else "All"
+    return (COGS_TYPES[task["column"]], bool(task["outlier"]), int(task["material"]), storage)
+
+
+def result_keys(df_results):
+    """
+    Series key of every row of a forecast output, see result_key.
+    """
+    return pd.MultiIndex.from_arrays([
+        df_results["COGS Type"].astype(str),
+        df_results["Outlier"].astype(bool),
+        df_results["Material Code"].astype(np.int64),
+        df_results["Storage Location Code"].astype(str),
+    ])
+
+
+def series_digest(task):
+    """
+    Hash of the dates and values of a series, changes whenever the
+    series gets a new month or a revised value.
+    """
+    df = task["df"].sort_values("Date")
+    digest = hashlib.sha1(df["Date"].to_numpy(dtype="datetime64[ns]").tobytes())
+    digest.update(df[task["column"]].to_numpy(dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def reconcile_bottom_up(tasks, df_forecasts):
+    """
+    Derive the forecasts of "All" storage tasks from the storage level:
+    for every month of a task's horizon, the mean of its material's
+    storage forecasts, the way all_storage_grouper averages the storage
+    means. Tasks with a month no storage forecast covers are left to be
+    fitted directly.
+
+    Parameters
+    ----------
+    tasks: list of dict
+        "All" storage tasks as accepted by fit_series
+    df_forecasts: DataFrame
+        Forecast output holding the storage level forecasts
+
+    Returns
+    -------
+    int: number of tasks given a `reconciled` entry
+    """
+    specific = df_forecasts[df_forecasts["Storage Location Code"].astype(str) != "All"]
+    means = specific.groupby(
+        [specific["COGS Type"].astype(str), "Outlier", "Material Code", "Date"], observed=True
+    )["COGS Value"].mean()
+    children = {key: group.droplevel([0, 1, 2]) for key, group in means.groupby(level=[0, 1, 2])}
+
+    n_reconciled = 0
+    for task in tasks:
+        cogs_type, outlier, material, _ = result_key(task)
+        if (cogs_type, outlier, material) not in children:
+            continue
+
+        dates = utils.postprocess(task["df"], None, task["column"], False)
+        forecast = children[(cogs_type, outlier, material)].reindex(dates)
+        if forecast.isna().any():
+            continue
+
+        task["reconciled"] = {
+            "seasonal_period": None,
+            "params": None,
+            "engine": "bottom-up",
+            "fit_mode": "reconciled",
+            "iterations": 0,
+            "n_fits": 0,
+            "screened_out": [],
+            "forecast": forecast.to_numpy(),
+        }
+        n_reconciled += 1
+
+    return n_reconciled
+
+
+def route_series(tasks):
+    """
+    Classify every task with utils.classify_series and forecast the
+    all-zero, constant, too short and intermittent ones with their cheap
+    method, attached to the task as a `fast_path` entry. The others are
+    left for SARIMAX.
+
+    Parameters
+    ----------
+    tasks: list of dict
+        Series tasks as accepted by fit_series
+
+    Returns
+    -------
+    dict: number of tasks per forecast method
+    """
+    counts = {}
+    for task in tasks:
+        values = task["df"].sort_values("Date")[task["column"]].to_numpy(dtype=np.float64)
+        series_class = utils.classify_series(values)
+        if series_class == "sarimax":
+            continue
+
+        forecast, seasonal_period = utils.fast_forecast(values, series_class)
+        method = FAST_PATH_METHODS[series_class]
+        task["fast_path"] = {
+            "seasonal_period": seasonal_period,
+            "params": None,
+            "engine": method,
+            "fit_mode": "fast_path",
+            "iterations": 0,
+            "n_fits": 0,
+            "screened_out": [],
+            "forecast": forecast,
+        }
+        counts[method] = counts.get(method, 0) + 1
+
+    return counts
+
+
+def batch_forecast(tasks):
+    """
+    Forecast tasks with the vectorized engine (utils.batch_train_predict),
+    one batch per series length. Stable forecasts are attached to their
+    task as a `batched` entry, the others are left for SARIMAX.
+
+    Parameters
+    ----------
+    tasks: list of dict
+        Series tasks as accepted by fit_series
+
+    Returns
+    -------
+    int: number of tasks forecasted by the batched engine
+    """
+    # Group the series by length, each group is one array. Series with a missing month are left for SARIMAX
+    by_length = {}
+    for task in tasks:
+        values = task["df"].sort_values("Date")[task["column"]].to_numpy(dtype=np.float64)
+        if np.isnan(values).any():
+            continue
+        by_length.setdefault(len(values), []).append((task, values))
+
+    n_batched = 0
+    for group in by_length.values():
+        output = utils.batch_train_predict(np.vstack([values for _, values in group]))
+        if output is None:
+            continue
+
+        forecasts, valid, seasonal_period, params = output
+        for (task, _), forecast, is_valid, series_params in zip(group, forecasts, valid, params):
+            if not is_valid:
+                continue
+            task["batched"] = {
+                "seasonal_period": seasonal_period,
+                "params": series_params,
+                "fit_mode": "batch",
+                "iterations": 0,
+                "n_fits": 0,
+                "screened_out": [],
+                "engine": "ets",
+                "forecast": forecast,
+            }
+            n_batched += 1
+
+    return n_batched
+
+
+def backtest_series(task):
+    """
+    Rolling-origin backtest of a series: the model is selected and
+    fitted once, with train_predict, on the months before the first
+    origin, and every later origin only appends the months that became
+    known to its state. Errors are captured and returned, see fit_series.
+
+    Parameters
+    ----------
+    task: dict
+        Series task as accepted by fit_series, with a `backtest` entry
+        holding the number of `origins` (the last months of the series),
+        the `horizon` forecasted from each origin and whether the
+        `fast_path` methods of route_series are used
+
+    Returns
+    -------
+    (result, info, error): the accuracy row of the series, the fit info
+    and the error message, if any
+    """
+    df = task["df"].sort_values("Date").reset_index(drop=True)
+    col = task["column"]
+    values = df[col].to_numpy(dtype=np.float64)
+    backtest = task["backtest"]
+    first_origin = len(values) - backtest["origins"]
+    info = None
+
+    try:
+        if first_origin < 2:
+            raise ValueError(f"{len(values)} months are too few for {backtest['origins']} origins")
+
+        method = utils.classify_series(values[:first_origin]) if backtest["fast_path"] else "sarimax"
+        if method != "sarimax":
+            # Nothing to fit, the cheap method forecasts from every origin
+            start = time.perf_counter()
+            forecasts = utils.rolling_fast_forecasts(values, method, first_origin, backtest["horizon"])
+            info = {"engine": FAST_PATH_METHODS[method], "seasonal_period": None, "n_fits": 0,
+                    "seconds": time.perf_counter() - start}
+        else:
+            with time_limit(fit_limit(task)):
+                forecast, info = utils.train_predict(df.iloc[:first_origin], col, return_info=True)
+                if forecast is None:
+                    raise ValueError("No valid SARIMAX model could be trained")
+                forecasts = utils.rolling_forecasts(
+                    values, info["seasonal_period"], info["params"], first_origin, backtest["horizon"]
+                )
+
+        accuracy = utils.forecast_accuracy(values, forecasts, first_origin)
+        result = {
+            "material_desc": df["Material Desc"].values[0],
+            "Material Code": task["material"],
+            "Storage Location Code": str(task["storage"]) if task["storage"] else "All",
+            "COGS Type": COGS_TYPES[col],
+            "Outlier": task["outlier"],
+            "Method": info["engine"],
+            "Seasonal Period": info["seasonal_period"],
+            "Origins": backtest["origins"],
+            "Horizon": backtest["horizon"],
+            "Points": accuracy["points"],
+            "Actual": accuracy["actual"],
+            "MAPE": accuracy["mape"],
+            "WAPE": accuracy["wape"],
+        }
+        return result, info, None
+
+    except FitTimeout:
+        return None, info, f"Timed out after {fit_limit(task):.0f}s"
+    except Exception as error:
+        return None, info, str(error)
+
+
+def run_series(tasks, workers=1, log_file=None, candidate_workers=1, chunksize=None, multi_target=False):
+    """
+    Fit every task, either in-process or on a process pool.
+    Results are yielded in the same order as `tasks`, whatever the
+    number of workers, so the output is deterministic.
+
+    Series run sequentially can instead fit their seasonal period
+    candidates in parallel, which suits runs with few long series.
+    With a series pool the cores are already busy, so candidates are
+    then fitted one after the other.
+
+    Parameters
+    ----------
+    tasks: list of dict
+        Series tasks as accepted by fit_series
+    workers: int, default = 1
+        Number of worker processes, 1 runs sequentially
+    log_file: string, default = None
+        Run log file that pool workers should also write to
+    candidate_workers: int, default = 1
+        Number of worker processes fitting the seasonal period
+        candidates of a series when the series run sequentially
+    chunksize: int, default = None
+        Number of tasks handed to a pool worker at once, defaults to a
+        quarter of the tasks per worker. Use 1 with tasks sorted by
+        decreasing cost to balance the load.
+    multi_target: Boolean, default = False
+        Fit the adjacent tasks of a series together with fit_targets,
+        `tasks` should then come from order_by_series. Chunks count
+        series instead of tasks.
+    """
+    if multi_target:
+        groups, start = [], 0
+        for i in range(1, len(tasks) + 1):
+            if i == len(tasks) or series_id(tasks[i]) != series_id(tasks[start]):
+                groups.append(tasks[start:i])
+                start = i
+        outputs = (
+            output
+            for outputs in _run(fit_targets, groups, workers, log_file, candidate_workers, chunksize)
+            for output in outputs
+        )
+    else:
+        outputs = _run(fit_series, tasks, workers, log_file, candidate_workers, chunksize)
+
+    # Report progress about every tenth of the tasks
+    step = max(1, len(tasks) // 10)
+    for done, output in enumerate(outputs, start=1):
+        if done % step == 0 or done == len(tasks):
+            logger.info(f"Progress: {done}/{len(tasks)} series done")
+        yield output
+
+
+class FitSession(object):
+    """
+    The fitting step shared by main_predict and main_batch, around
+    run_series: prepare the tasks left to fit, then record every result
+    in the model cache, the warm-start params, the run log and the run
+    profile. Tasks carry their `client`, so one session can span the
+    series of several clients.
+
+    Parameters
+    ----------
+    profile: RunProfile
+        Profile of the run, every series is recorded in it
+    warm_start_dir: string
+        Folder of the fitted params of every client, `<client>.pkl`
+    model_cache: ModelCache, default = None
+        Cache to look the series up in and store new fits in
+    engine: string, default = "sarimax"
+        "ets" forecasts the series the batched engine can handle first
+    warm_start: Boolean, default = False
+        Seed the fits with the params stored by the previous run
+    multi_target: Boolean, default = False
+        The measures of a series are fitted together, see fit_targets,
+        so their cache keys include the measures fitted before them
+    """
+
+    def __init__(self, profile, warm_start_dir, model_cache=None, engine="sarimax", warm_start=False, multi_target=False):
+        self.profile = profile
+        self.warm_start_dir = str(warm_start_dir)
+        self.model_cache = model_cache
+        self.engine = engine
+        self.warm_start = warm_start
+        self.multi_target = multi_target
+
+        self.previous = {}
+        self.current = {}
+        self.iterations = {}
+        self.fallbacks = {}
+        self.n_fitted = self.n_fits = 0
+
+    def warm_start_file(self, client):
+        return os.path.join(self.warm_start_dir, f"{client}.pkl")
+
+    def previous_fits(self, client):
+        """
+        Params stored for `client` by its previous run, loaded once.
+        """
+        if client not in self.previous:
+            path = self.warm_start_file(client)
+            self.previous[client] = utils.load(path) if os.path.exists(path) else {}
+            self.current[client] = {}
+            if self.warm_start:
+                logger.info(f"Warm start: {len(self.previous[client])} previous fits loaded from {path}")
+        return self.previous[client]
+
+    def prepare(self, tasks):
+        """
+        Cache lookup, warm-start seeding and batched engine of the tasks
+        that still need a fit. Call it on every pass before run_series.
+        """
+        pending = [task for task in tasks if precomputed(task) is None]
+
+        # Look up every series in the model cache, only misses get fitted
+        if self.model_cache is not None:
+            hits, misses = self.model_cache.hits, self.model_cache.misses
+            with self.profile.stage("cache_lookup"):
+                for task in pending:
+                    shared_columns = COLUMNS[:COLUMNS.index(task["column"])] if self.multi_target else ()
+                    task["cache_key"] = self.model_cache.key(task["df"], task["column"], self.engine, shared_columns)
+                    task["cached"] = self.model_cache.get(task["cache_key"])
+            logger.info(
+                f"Model cache: {self.model_cache.hits - hits} hits, {self.model_cache.misses - misses} series to fit"
+            )
+            pending = [task for task in pending if task["cached"] is None]
+
+        # Seed the fits with the parameters stored by the previous run
+        if self.warm_start:
+            for task in pending:
+                task["warm_start"] = self.previous_fits(task["client"]).get(self.fit_id(task))
+
+        # Forecast everything the vectorized engine can, SARIMAX is the fallback
+        if self.engine == "ets":
+            with self.profile.stage("batch_forecast"):
+                n_batched = batch_forecast(pending)
+            logger.info(f"Batched engine: {n_batched} series forecasted, the rest falls back to SARIMAX")
+
+    @staticmethod
+    def fit_id(task):
+        # Key of a series in the warm-start params of its client
+        return (task["column"], task["outlier"], task["material"], task["storage"])
+
+    def record(self, task, info, error):
+        """
+        Book the outcome of a task returned by run_series.
+        """
+        # Store newly fitted series, failed fits included so they are not retried, fits out of time are
+        if info is not None and info.get("fallback"):
+            self.fallbacks[info["fit_mode"]] = self.fallbacks.get(info["fit_mode"], 0) + 1
+        elif self.model_cache is not None and "cache_key" in task and task["cached"] is None and info is not None:
+            self.model_cache.put(task["cache_key"], info)
+
+        if info is not None and info["seasonal_period"] is not None and info.get("engine") == "sarimax":
+            self.previous_fits(task["client"])
+            self.current[task["client"]][self.fit_id(task)] = {
+                "values": task["df"].sort_values("Date")[task["column"]].to_numpy(),
+                "seasonal_period": info["seasonal_period"],
+                "params": info["params"],
+            }
+
+        # Report the effort of every series fitted in this run
+        if precomputed(task) is None and info is not None:
+            logger.info(
+                f"Client {task['client']}, Material {task['material']}, Storage {task['storage'] or 'All'}, "
+                f"{task['column']}: {info['n_fits']} fits ({len(info['screened_out'])} periods screened out), "
+                f"seasonal period {info['seasonal_period']}, "
+                f"{info['fit_mode']} fit, {info['iterations']} iterations in {info['seconds']:.2f}s"
+            )
+            self.n_fitted += 1
+            self.n_fits += info["n_fits"]
+
+        # Only real SARIMAX fits count, cached, fast-path, batched, reconciled and fallback results have no iterations
+        if self.warm_start and precomputed(task) is None and info is not None and not info.get("fallback"):
+            mode_iterations = self.iterations.setdefault(info["fit_mode"], [0, 0])
+            mode_iterations[0] += 1
+            mode_iterations[1] += info["iterations"]
+
+        if error is not None:
+            logger.warning(f"Error for client {task['client']}, Material {task['material']}: {error}")
+        self.profile.record_series(task, info, error)
+
+    def save_fits(self, client):
+        """
+        Store the fitted params of `client` for its next warm-started
+        run, series not fitted this run keep their previous entry.
+        """
+        utils.save({**self.previous_fits(client), **self.current[client]}, self.warm_start_file(client))
+
+    def summary(self):
+        """
+        Log the fit effort and fallbacks of the run and keep the model
+        cache within its size budget.
+        """
+        logger.info(f"Fitted {self.n_fitted} series with {self.n_fits} SARIMAX fits")
+        for reason, n_series in self.fallbacks.items():
+            logger.warning(f"{n_series} series fell back to a seasonal naive forecast ({reason})")
+        for fit_mode, (n_series, n_iterations) in self.iterations.items():
+            logger.info(f"Warm start: {n_series} {fit_mode} fits, {n_iterations} optimizer iterations in total")
+
+        if self.model_cache is not None:
+            self.model_cache.prune()
+
+
+def run_backtest(tasks, workers=1, log_file=None, chunksize=None):
+    """
+    Backtest every task with backtest_series, see run_series.
+    """
+    yield from _run(backtest_series, tasks, workers, log_file, 1, chunksize)
+
+
+def _run(func, tasks, workers, log_file, candidate_workers, chunksize):
+    # Apply func to every task in order, see run_series
+    # Load the models before any pool forks, so workers inherit them instead of importing statsmodels each
+    if (workers > 1 and len(tasks) > 1) or candidate_workers > 1:
+        importlib.import_module("src.utilities.modeling")
+
+    if (workers <= 1 or len(tasks) <= 1) and candidate_workers > 1:
+        with ProcessPoolExecutor(max_workers=candidate_workers) as executor:
+            for task in tasks:
+                yield func(task, executor)
+        return
+
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield func(task)
+        return
+
+    # Hand out tasks in chunks to amortize the pickling round-trips
+    if chunksize is None:
+        chunksize = max(1, len(tasks) // (workers * 4))
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=configure_logger if log_file else None,
+        initargs=(log_file,) if log_file else (),
+    ) as executor:
+        yield from executor.map(func, tasks, chunksize=chunksize)
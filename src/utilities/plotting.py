@@ -0,0 +1,32 @@
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+
+def early_plot(df, column):
+    # Column could be AVG Total RM, EA / CTN
+    # Plot
+    plt.figure(figsize=(10, 5))
+    sns.lineplot(x=df["Date"], y=df[column], marker='o', linestyle='-')
+
+    # Labels & Title
+    plt.xlabel("Invoice Date")
+    plt.ylabel(column)
+    plt.title(f"{column} Over Time")
+    plt.xticks(rotation=45)  # Rotate x-axis labels for better readability
+    plt.grid(True)
+
+    # Show plot
+    plt.show()
+
+def plot_forecast(df_base_sample, future_dates, forecast, column):
+    # Plot actual data and forecast
+    plt.figure(figsize=(10, 5))
+    plt.plot(df_base_sample.Date, df_base_sample[column], label="Actual Data", marker='o')
+    plt.plot(future_dates, forecast, label="Forecast", linestyle='dashed', marker='x', color='red')
+
+    plt.xlabel("Date")
+    plt.ylabel(column)
+    plt.title(f"Corrected Forecast of {column}")
+    plt.legend()
+    plt.grid(True)
+    plt.show()
@@ -0,0 +1,156 @@
+import io
+import json
+import time
+import pstats
+import cProfile
+
+from contextlib import contextmanager
+from datetime import datetime
+from loguru import logger
+
+
+def _to_json(value):
+    # numpy scalars and arrays found in task keys and fit params
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+class RunProfile(object):
+    """
+    Machine-readable profile of a forecasting run, appended as JSON lines
+    to `profile_file`: one `stage` event per pipeline stage, one `series`
+    event per series with its fit attempts, and a closing `summary`.
+    Every event carries the `run` timestamp so runs of the same day can
+    be told apart.
+    """
+
+    def __init__(self, profile_file):
+        self.profile_file = str(profile_file)
+        self.run = datetime.now().isoformat(timespec="seconds")
+        self.stages = {}
+        self.series = []
+
+    def event(self, event, **fields):
+        """
+        Append one event to the profile file.
+        """
+        with open(self.profile_file, "a") as f:
+            f.write(json.dumps({"run": self.run, "event": event, **fields}, default=_to_json) + "\n")
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time the enclosed block as the pipeline stage `name`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+            logger.info(f"Stage {name} took {seconds:.2f}s")
+            self.event("stage", stage=name, seconds=round(seconds, 4))
+
+    def record_series(self, task, info, error=None):
+        """
+        Record a series and, when it was fitted in this run, the time,
+        optimizer iterations and outcome of each of its fit attempts.
+
+        Parameters
+        ----------
+        task: dict
+            Series task as accepted by pipeline.fit_series
+        info: dict
+            Fit info returned for the task, None if the fit crashed
+        error: string, default = None
+            Error message of the series, if any
+        """
+        if task.get("cached") is not None:
+            source = "cache"
+        elif task.get("batched") is not None:
+            source = "batch"
+        elif task.get("reconciled") is not None:
+            source = "reconciled"
+        elif task.get("fast_path") is not None:
+            source = "fast_path"
+        else:
+            source = "fit"
+
+        fitted = source == "fit" and info is not None
+        series = {
+            "column": task["column"],
+            "outlier": task["outlier"],
+            "material": task["material"],
+            "storage": task["storage"],
+            "source": source,
+            "seasonal_period": None if info is None else info["seasonal_period"],
+            "engine": None if info is None else info.get("engine"),
+            "seconds": round(info["seconds"], 4) if fitted else 0.0,
+            "iterations": info["iterations"] if fitted else 0,
+            "attempts": info["attempts"] if fitted else [],
+            "error": error,
+        }
+        self.series.append(series)
+        self.event("series", **series)
+
+    def summary(self, top_n=10):
+        """
+        Log the stage breakdown, the `top_n` slowest series and the time
+        spent on fits that were rejected, and append it as a `summary`
+        event.
+        """
+        fit_seconds = sum(series["seconds"] for series in self.series)
+        rejected = [
+            attempt for series in self.series for attempt in series["attempts"] if attempt["status"] != "ok"
+        ]
+        rejected_seconds = sum(attempt["seconds"] for attempt in rejected)
+        slowest = sorted(self.series, key=lambda series: series["seconds"], reverse=True)[:top_n]
+
+        for name, seconds in self.stages.items():
+            logger.info(f"Profile: stage {name} {seconds:.2f}s")
+        logger.info(
+            f"Profile: {fit_seconds:.2f}s fitting series, {rejected_seconds:.2f}s "
+            f"({rejected_seconds / fit_seconds if fit_seconds else 0:.0%}) on {len(rejected)} rejected fits"
+        )
+        for series in slowest:
+            logger.info(
+                f"Profile: {series['seconds']:.2f}s Material {series['material']}, "
+                f"Storage {series['storage'] or 'All'}, {series['column']}, Outlier {series['outlier']}: "
+                + ", ".join(f"s={a['seasonal_period']} {a['status']} {a['seconds']:.2f}s" for a in series["attempts"])
+            )
+
+        self.event(
+            "summary",
+            stages={name: round(seconds, 4) for name, seconds in self.stages.items()},
+            n_series=len(self.series),
+            fit_seconds=round(fit_seconds, 4),
+            rejected_fits=len(rejected),
+            rejected_seconds=round(rejected_seconds, 4),
+            slowest=[
+                {key: series[key] for key in ("column", "outlier", "material", "storage", "seconds")}
+                for series in slowest
+            ],
+        )
+
+
+def start_cpu_profile():
+    """
+    Start a cProfile profiler for a deep dive into the current process.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def dump_cpu_profile(profiler, output_file, top_n=30):
+    """
+    Stop `profiler`, save its stats to `output_file` (readable with
+    pstats or snakeviz) and log the `top_n` functions by cumulative time.
+    """
+    profiler.disable()
+    profiler.dump_stats(output_file)
+
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(top_n)
+    logger.info(f"cProfile stats saved to {output_file}\n{stream.getvalue()}")
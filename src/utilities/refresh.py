@@ -0,0 +1,215 @@
+import os
+import time
+import threading
+import multiprocessing
+
+import pandas as pd
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from loguru import logger
+
+import src.utilities.utils as utils
+import src.utilities.store as store
+import src.utilities.pipeline as pipeline
+from src.utilities.schema import compact_output
+
+# Jobs kept for status display once finished, the oldest are forgotten first
+MAX_FINISHED_JOBS = 100
+
+
+def selection_storage(storage):
+    """
+    Storage Location Code of the forecast output for a dashboard
+    selection: "All" or the storage code as a string.
+    """
+    return "All" if str(storage) == "All" else str(storage)
+
+
+def refresh_forecast(client, material, storage, fast_path=True, timeout=None):
+    """
+    Refit the series of one material at one storage, both outlier
+    settings and the three measures, the way main_predict fits them.
+    Only the rows of the material are read, its "All" storage series
+    only depends on them. Runs in a worker process of RefreshQueue.
+
+    Parameters
+    ----------
+    client: string
+        Client name, e.g. morgan
+    material: int
+        Material Code
+    storage: string
+        "All" or a Storage Location Code
+    fast_path: Boolean, default = True
+        Forecast degenerate series with the cheap methods of route_series
+    timeout: float, default = None
+        Seconds a series may spend fitting, see pipeline.fit_series
+
+    Returns
+    -------
+    (results, errors): the result columns of every fitted series, as
+    accepted by ResultWriter.append, and the error of every failed one
+    """
+    df = store.read_client(
+        client, columns=store.PIPELINE_COLUMNS, filters=[("Material Code", "==", int(material))]
+    )
+    storage = selection_storage(storage)
+    tasks = [
+        task for task in pipeline.build_tasks(df, keep_short=fast_path)
+        if pipeline.result_key(task)[3] == storage
+    ]
+    if fast_path:
+        pipeline.route_series(tasks)
+
+    results = []
+    errors = []
+    for task in tasks:
+        task["timeout"] = timeout
+        result, info, error = pipeline.fit_series(task)
+        if error is not None:
+            errors.append(f"{task['column']}, Outlier {task['outlier']}: {error}")
+        elif result is not None:
+            results.append(result)
+    return results, errors
+
+
+def merge_results(path, results):
+    """
+    Replace the rows of the refitted series in the forecast feather at
+    `path` and save it atomically. Series without a new result keep
+    their rows.
+
+    Returns
+    -------
+    Number of new forecast rows
+    """
+    df_new = pd.concat([pd.DataFrame(result) for result in results], ignore_index=True)
+    n_rows = len(df_new)
+
+    if os.path.exists(path):
+        df_previous = utils.load(path)
+        replaced = pipeline.result_keys(df_new).unique()
+        kept = ~pipeline.result_keys(df_previous).isin(replaced)
+        df_new = pd.concat([df_previous[kept], df_new], ignore_index=True)
+
+    utils.save(compact_output(df_new), path)
+    return n_rows
+
+
+class RefreshQueue(object):
+    """
+    Background queue of on-demand forecast refreshes. Each job refits
+    one material/storage selection with refresh_forecast on a process
+    pool, so the caller never blocks, and merges the new forecasts into
+    the client's forecast feather as soon as it completes. A selection
+    already waiting or running is not queued twice.
+
+    Parameters
+    ----------
+    workers: int, default = 1
+        Worker processes, started on the first submitted job
+    fast_path: Boolean, default = True
+        Forecast degenerate series with cheap methods
+    timeout: float, default = None
+        Seconds a series may spend fitting
+    """
+
+    def __init__(self, workers=1, fast_path=True, timeout=None):
+        self.workers = workers
+        self.fast_path = fast_path
+        self.timeout = timeout
+        self.executor = None
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+    def _executor(self):
+        # Spawned rather than forked, the dashboard server is multi-threaded
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.executor
+
+    @staticmethod
+    def job_key(client, material, storage):
+        return (client, int(material), selection_storage(storage))
+
+    def submit(self, client, material, storage, path):
+        """
+        Queue a refresh of a selection whose forecasts are merged into
+        the feather at `path`, and return its job.
+        """
+        key = self.job_key(client, material, storage)
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None and job["status"] in ("queued", "running"):
+                return job
+
+            job = {
+                "client": client,
+                "material": key[1],
+                "storage": key[2],
+                "status": "queued",
+                "submitted": time.time(),
+                "finished": None,
+                "rows": 0,
+                "errors": [],
+            }
+            self.jobs.pop(key, None)
+            self.jobs[key] = job
+            job["future"] = self._executor().submit(
+                refresh_forecast, client, key[1], key[2], self.fast_path, self.timeout
+            )
+
+        logger.info(f"Refresh queued: {client}, Material {key[1]}, Storage {key[2]}")
+        job["future"].add_done_callback(lambda future: self._finish(job, path, future))
+        return job
+
+    def _finish(self, job, path, future):
+        # Merge the forecasts of a completed job, one merge at a time
+        try:
+            results, job["errors"] = future.result()
+            if results:
+                with self.write_lock:
+                    job["rows"] = merge_results(path, results)
+            job["status"] = "done" if results else "failed"
+        except Exception as error:
+            job["errors"] = [str(error)]
+            job["status"] = "failed"
+        job["finished"] = time.time()
+
+        logger.info(
+            f"Refresh {job['status']}: {job['client']}, Material {job['material']}, Storage {job['storage']} "
+            f"in {job['finished'] - job['submitted']:.1f}s" + "".join(f"\n  {error}" for error in job["errors"])
+        )
+        self._forget_finished()
+
+    def _forget_finished(self):
+        with self.lock:
+            finished = [key for key, job in self.jobs.items() if job["finished"] is not None]
+            for key in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self.jobs[key]
+
+    def status(self, client, material, storage):
+        """
+        Latest job of a selection, None if it was never refreshed. A
+        queued job reads "running" once a worker picked it up.
+        """
+        with self.lock:
+            job = self.jobs.get(self.job_key(client, material, storage))
+        if job is not None and job["status"] == "queued" and job["future"].running():
+            job["status"] = "running"
+        return job
+
+    def pending(self):
+        """
+        Number of jobs queued or running.
+        """
+        with self.lock:
+            return sum(job["finished"] is None for job in self.jobs.values())
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+from loguru import logger
+
+# Bump to re-ingest every client when the stored types change
+SCHEMA_VERSION = 2
+
+# Text code and description columns, stripped of their padding and stored as categoricals
+CATEGORICAL_COLUMNS = [
+    "Inv Date (MMM-YYYY)",
+    "Material Group Desc",
+    "Material Desc",
+    "Plant Code",
+    "Storage Location Desc",
+    "Payer Customer Group",
+    "Payer Customer Group 1",
+    "Payer Customer",
+    "Sales Department Code",
+    "Status",
+]
+
+# Numeric codes and counts downcast when every value fits. Storage codes
+# have missing values so they stay floats, exact in float32 below 2**24.
+NUMERIC_TYPES = {
+    "Material Group Code": np.int16,
+    "Material Code": np.int32,
+    "Storage Location Code": np.float32,
+    "Total COGS EA": np.int32,
+}
+
+# Columns read by each consumer of the store
+PIPELINE_COLUMNS = [
+    "Inv Date (MMM-YYYY)",
+    "Material Group Code",
+    "Material Group Desc",
+    "Material Code",
+    "Material Desc",
+    "Storage Location Code",
+    "Total COGS EA",
+    "Total COGS CTN",
+    "Total COGS Value",
+    "Outlier",
+]
+DASHBOARD_COLUMNS = [
+    "Inv Date",
+    "Inv Date (MMM-YYYY)",
+    "Material Code",
+    "Storage Location Code",
+    "Total COGS EA",
+    "Total COGS CTN",
+    "Total COGS Value",
+    "Outlier",
+]
+
+# Repeated keys of the forecast output
+OUTPUT_CATEGORICAL_COLUMNS = [
+    "material_group_desc",
+    "material_desc",
+    "Storage Location Code",
+    "COGS Type",
+    "Method",
+]
+
+
+def _fits(values, dtype):
+    # Whether every value survives the cast unchanged
+    values = values.to_numpy()
+    if np.issubdtype(dtype, np.integer):
+        if values.dtype.kind not in "iu":
+            return False
+        info = np.iinfo(dtype)
+        return values.size == 0 or (values.min() >= info.min and values.max() <= info.max)
+
+    present = values[~np.isnan(values)]
+    return bool(np.all(present.astype(dtype) == present))
+
+
+def apply_schema(df):
+    """
+    Give a raw client frame its stored types: parsed invoice dates,
+    stripped categorical text and downcast numeric codes. A numeric
+    column whose values do not fit its declared type keeps its type.
+
+    Parameters
+    ----------
+    df: DataFrame
+        Client CSV as read by pd.read_csv
+    """
+    if "Inv Date" in df.columns:
+        df["Inv Date"] = pd.to_datetime(df["Inv Date"])
+
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            if df[column].dtype == object:
+                df[column] = df[column].str.strip()
+            df[column] = df[column].astype("category")
+
+    for column, dtype in NUMERIC_TYPES.items():
+        if column not in df.columns:
+            continue
+        if _fits(df[column], dtype):
+            df[column] = df[column].astype(dtype)
+        else:
+            logger.warning(f"Keeping {column} as {df[column].dtype}, its values do not fit {np.dtype(dtype)}")
+
+    return df
+
+
+def compact_output(df):
+    """
+    Store the repeated keys of a forecast frame as categoricals.
+    """
+    for column in OUTPUT_CATEGORICAL_COLUMNS:
+        df[column] = df[column].astype("category")
+    return df
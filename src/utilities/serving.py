@@ -0,0 +1,270 @@
+import os
+import json
+import math
+import threading
+
+import numpy as np
+import pyarrow.feather as feather
+
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from loguru import logger
+
+# Columns identifying a series of the forecast output, the client excluded
+KEY_COLUMNS = ["Material Code", "Storage Location Code", "COGS Type", "Outlier"]
+
+# Descriptive columns returned once per series
+SERIES_COLUMNS = ["material_group_code", "material_group_desc", "material_desc", "Method", "Fallback"]
+
+
+def storage_key(storage):
+    """
+    Normalize a storage location to the form used by the index: "All",
+    or the integer code as a string ("1001" for 1001, 1001.0 or "1001.0").
+    """
+    storage = str(storage).strip()
+    if storage.lower() == "all":
+        return "All"
+    try:
+        code = float(storage)
+    except ValueError:
+        return storage
+    return str(int(code)) if code.is_integer() else storage
+
+
+def series_key(material, storage, cogs_type, outlier):
+    """
+    Index key of a series: (material, storage, COGS type, outlier).
+    Material accepts integral numbers and their strings, outlier
+    booleans and the strings true/false/1/0.
+    """
+    try:
+        code = float(material)
+    except (TypeError, ValueError):
+        code = math.nan
+    if isinstance(material, bool) or not code.is_integer():
+        raise ValueError(f"Invalid material {material!r}")
+    if isinstance(outlier, str):
+        if outlier.lower() not in ("true", "false", "1", "0"):
+            raise ValueError(f"Invalid outlier flag {outlier!r}")
+        outlier = outlier.lower() in ("true", "1")
+    return (int(code), storage_key(storage), str(cogs_type).upper(), bool(outlier))
+
+
+class ClientForecasts(object):
+    """
+    Forecast output of one client, sorted so every series is one
+    contiguous block of rows, with an index from series key to row
+    range.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.version = self.file_version(self.path)
+        self.loaded_at = datetime.now().isoformat(timespec="seconds")
+
+        table = feather.read_table(self.path)
+        keys = table.select(KEY_COLUMNS).to_pandas()
+        keys["Storage Location Code"] = keys["Storage Location Code"].astype(str).map(storage_key)
+
+        # Make every series contiguous, rows within a series keep their date order
+        positions = keys.groupby(KEY_COLUMNS, sort=False, observed=True).indices
+        order = np.concatenate(list(positions.values())) if positions else np.array([], dtype=np.int64)
+        self.table = table.take(order)
+
+        self.index = {}
+        start = 0
+        for key, rows in positions.items():
+            key = (int(key[0]), key[1], str(key[2]), bool(key[3]))
+            self.index[key] = (start, start + len(rows))
+            start += len(rows)
+
+        self.columns = [name for name in SERIES_COLUMNS if name in self.table.column_names]
+
+    @staticmethod
+    def file_version(path):
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def lookup(self, key):
+        """
+        Forecast of a series as a JSON-ready dict, None if unknown.
+        """
+        rows = self.index.get(key)
+        if rows is None:
+            return None
+
+        block = self.table.slice(rows[0], rows[1] - rows[0])
+        first = block.slice(0, 1).select(self.columns).to_pylist()[0]
+        dates = block.column("Date").to_numpy().astype("datetime64[D]").astype(str).tolist()
+        values = [None if value is None or math.isnan(value) else value for value in block.column("COGS Value").to_pylist()]
+
+        return {
+            "material": key[0],
+            "storage": key[1],
+            "cogs_type": key[2],
+            "outlier": key[3],
+            **{name.lower().replace(" ", "_"): value for name, value in first.items()},
+            "dates": dates,
+            "values": values,
+        }
+
+
+class ForecastStore(object):
+    """
+    Forecast outputs of several clients, loaded on first use and
+    reloaded when their file changes on disk. main_predict replaces the
+    file atomically, so a reload always sees a complete file and lookups
+    keep using the previous one until the new one is indexed.
+
+    Parameters
+    ----------
+    paths: dict
+        Client name mapped to the path of its forecast feather
+    """
+
+    def __init__(self, paths):
+        self.paths = {client: str(path) for client, path in paths.items()}
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get(self, client):
+        """
+        Indexed forecasts of `client`, reloaded if its file changed.
+        """
+        path = self.paths.get(client)
+        if path is None:
+            raise KeyError(f"Unknown client {client}")
+
+        current = self.clients.get(client)
+        try:
+            version = ClientForecasts.file_version(path)
+        except FileNotFoundError:
+            if current is None:
+                raise KeyError(f"No forecasts for client {client}")
+            return current
+
+        if current is not None and current.version == version:
+            return current
+
+        with self.lock:
+            current = self.clients.get(client)
+            if current is None or current.version != version:
+                try:
+                    current = ClientForecasts(path)
+                except Exception as error:
+                    if current is None:
+                        raise
+                    logger.warning(f"Keeping the previous forecasts of {client}, reload failed: {error}")
+                    return current
+                self.clients[client] = current
+                logger.info(f"Loaded {len(current.index)} series of {client} from {path}")
+        return current
+
+    def lookup(self, client, material, storage, cogs_type, outlier):
+        """
+        Forecast of one series, None if the client has no such series.
+        """
+        return self.get(client).lookup(series_key(material, storage, cogs_type, outlier))
+
+    def status(self):
+        """
+        Loaded file, row and series count of every client.
+        """
+        status = {}
+        for client in self.paths:
+            try:
+                forecasts = self.get(client)
+            except (KeyError, OSError) as error:
+                status[client] = {"error": str(error)}
+                continue
+            status[client] = {
+                "path": forecasts.path,
+                "rows": forecasts.table.num_rows,
+                "series": len(forecasts.index),
+                "loaded_at": forecasts.loaded_at,
+            }
+        return status
+
+
+class ForecastHandler(BaseHTTPRequestHandler):
+    """
+    JSON endpoints of the serving API:
+
+    - GET /health: loaded clients
+    - GET /forecast?client=&material=&storage=&cogs_type=&outlier=: one series
+    - POST /forecast/batch with {"requests": [{client, material, storage,
+      cogs_type, outlier}, ...]}: many series, null for unknown ones
+    """
+
+    store = None
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _lookup(self, query):
+        # A malformed query raises ValueError, an unknown client KeyError
+        if not isinstance(query, dict):
+            raise ValueError(f"Invalid request {query!r}")
+        missing = [name for name in ("client", "material") if name not in query]
+        if missing:
+            raise ValueError(f"Missing {', '.join(missing)}")
+        return self.store.lookup(
+            query["client"], query["material"], query.get("storage", "All"),
+            query.get("cogs_type", "RM"), query.get("outlier", False),
+        )
+
+    def _lookup_or_none(self, query):
+        # One unknown client or malformed entry answers null, not the whole batch
+        try:
+            return self._lookup(query)
+        except (KeyError, ValueError, TypeError):
+            return None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            return self._send(200, {"clients": self.store.status()})
+        if url.path != "/forecast":
+            return self._send(404, {"error": f"Unknown endpoint {url.path}"})
+
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            forecast = self._lookup(query)
+        except KeyError as error:
+            return self._send(404, {"error": str(error).strip("'")})
+        except ValueError as error:
+            return self._send(400, {"error": str(error)})
+        if forecast is None:
+            return self._send(404, {"error": "Unknown series"})
+        self._send(200, forecast)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/forecast/batch":
+            return self._send(404, {"error": f"Unknown endpoint {self.path}"})
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            queries = json.loads(self.rfile.read(length))["requests"]
+            results = [self._lookup_or_none(query) for query in queries]
+        except (KeyError, ValueError, TypeError) as error:
+            return self._send(400, {"error": str(error).strip("'")})
+        self._send(200, {"results": results})
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+def make_server(store, host="127.0.0.1", port=8600):
+    """
+    HTTP server answering from `store`, each request on its own thread.
+    Port 0 picks a free port, see server.server_address.
+    """
+    handler = type("Handler", (ForecastHandler,), {"store": store})
+    return ThreadingHTTPServer((host, port), handler)
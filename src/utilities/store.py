@@ -0,0 +1,170 @@
+import os
+import glob
+import json
+
+import pandas as pd
+
+from loguru import logger
+
+from src.utilities.config_ import train_data_path, store_data_path
+from src.utilities.schema import SCHEMA_VERSION, PIPELINE_COLUMNS, DASHBOARD_COLUMNS, apply_schema
+
+MANIFEST_NAME = "_manifest.json"
+
+
+def _read_manifest(client_dir):
+    path = os.path.join(client_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(client_dir, manifest):
+    path = os.path.join(client_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _source_stamp(csv_file):
+    stat = os.stat(csv_file)
+    return {"mtime": stat.st_mtime, "size": stat.st_size}
+
+
+def convert_csv(csv_file):
+    """
+    Read one client CSV with the stored types of schema.apply_schema:
+    parsed invoice dates, stripped categoricals for codes and
+    descriptions and downcast numeric codes.
+
+    Parameters
+    ----------
+    csv_file: string
+        Path of the CSV to convert
+    """
+    return apply_schema(pd.read_csv(csv_file))
+
+
+def ingest_client(client, force=False, source_dir=None, store_dir=None):
+    """
+    Convert the CSVs of a client into the columnar store, partitioned by
+    invoice year (data/store/<client>/year=YYYY/<csv name>.parquet).
+    Only CSVs that are new or changed since the last ingest are
+    converted (or every CSV after a schema change), and outputs of
+    deleted CSVs are removed.
+
+    Parameters
+    ----------
+    client: string
+        Client name, e.g. morgan
+    force: Boolean, default = False
+        Convert every CSV even if it did not change
+    source_dir: string, default = None
+        Folder of the client CSVs, defaults to data/training/<client>
+    store_dir: string, default = None
+        Root of the store, defaults to data/store
+
+    Returns
+    -------
+    list of the CSV files converted
+    """
+    source_dir = source_dir or os.path.join(train_data_path, client)
+    client_dir = os.path.join(store_dir or store_data_path, client)
+    if not os.path.isdir(source_dir):
+        raise FileNotFoundError(f"No training data found for client {client} in {source_dir}")
+    os.makedirs(client_dir, exist_ok=True)
+
+    manifest = _read_manifest(client_dir)
+    csv_files = sorted(glob.glob(os.path.join(source_dir, "*.csv")))
+    csv_names = [os.path.basename(csv_file) for csv_file in csv_files]
+
+    # Drop the outputs of CSVs that no longer exist
+    for csv_name in list(manifest):
+        if csv_name not in csv_names:
+            for output in manifest.pop(csv_name)["outputs"]:
+                os.remove(os.path.join(client_dir, output))
+
+    converted = []
+    for csv_file, csv_name in zip(csv_files, csv_names):
+        stamp = _source_stamp(csv_file)
+        entry = manifest.get(csv_name)
+        if not force and entry is not None and entry["source"] == stamp and entry.get("schema") == SCHEMA_VERSION:
+            continue
+
+        logger.info(f"Ingesting {csv_file} into the columnar store...")
+        df = convert_csv(csv_file)
+
+        # Remove the previous outputs, the year split may have changed
+        for output in (entry or {}).get("outputs", []):
+            os.remove(os.path.join(client_dir, output))
+
+        outputs = []
+        stem = os.path.splitext(csv_name)[0]
+        for year, df_year in df.groupby(df["Inv Date"].dt.year):
+            output = os.path.join(f"year={year}", f"{stem}.parquet")
+            path = os.path.join(client_dir, output)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            df_year.to_parquet(path + ".tmp", index=False)
+            os.replace(path + ".tmp", path)
+            outputs.append(output)
+
+        manifest[csv_name] = {"source": stamp, "schema": SCHEMA_VERSION, "outputs": outputs}
+        converted.append(csv_file)
+
+    _write_manifest(client_dir, manifest)
+    return converted
+
+
+def is_stale(client, source_dir=None, store_dir=None):
+    """
+    Check whether any source CSV of a client was added, changed or
+    removed since it was last ingested, or was ingested with an older
+    schema.
+    """
+    source_dir = source_dir or os.path.join(train_data_path, client)
+    client_dir = os.path.join(store_dir or store_data_path, client)
+    if not os.path.isdir(client_dir):
+        return True
+
+    manifest = _read_manifest(client_dir)
+
+    csv_files = glob.glob(os.path.join(source_dir, "*.csv"))
+    if len(csv_files) != len(manifest):
+        return True
+
+    for csv_file in csv_files:
+        entry = manifest.get(os.path.basename(csv_file), {})
+        if entry.get("source") != _source_stamp(csv_file) or entry.get("schema") != SCHEMA_VERSION:
+            return True
+    return False
+
+
+def read_client(client, columns=None, filters=None, source_dir=None, store_dir=None):
+    """
+    Read the training data of a client from the columnar store,
+    refreshing the store first if a source CSV changed.
+
+    Parameters
+    ----------
+    client: string
+        Client name, e.g. morgan
+    columns: list of string, default = None
+        Columns to load, None loads every column
+    filters: list of tuple, default = None
+        Predicates pushed down to the parquet reader, e.g.
+        [("year", ">=", 2023), ("Outlier", "==", False)]
+    source_dir: string, default = None
+        Folder of the client CSVs, defaults to data/training/<client>
+    store_dir: string, default = None
+        Root of the store, defaults to data/store
+    """
+    source_dir = source_dir or os.path.join(train_data_path, client)
+
+    # Without source CSVs (e.g. a copied store) the store is used as is
+    if os.path.isdir(source_dir) and is_stale(client, source_dir, store_dir):
+        ingest_client(client, source_dir=source_dir, store_dir=store_dir)
+
+    client_dir = os.path.join(store_dir or store_data_path, client)
+    return pd.read_parquet(client_dir, columns=columns, filters=filters)
+
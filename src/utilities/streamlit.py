@@ -4,11 +4,15 @@ import pandas as pd
 import numpy as np
 import os
 import glob
+import threading
 import plotly.express as px
 import plotly.graph_objects as go
 
 import src.utilities.utils as utils
-from src.utilities.config_ import predicted_data_path, morgan_train_data_path, ferrero_train_data_path
+import src.utilities.store as store
+from src.utilities.refresh import RefreshQueue
+from collections import OrderedDict
+from src.utilities.config_ import predicted_data_path, train_data_path, store_data_path, config_path
 
 def greet():
     st.toast('Hello!', icon='✅')
@@ -19,33 +23,218 @@ def stspace(num):
     for j in range(num):
         st.write("")
 
+def predicted_path(client):
+    return os.path.join(predicted_data_path, f'{client}_predicted_.feather')
+
 def get_predicted_data(client):
-    df = utils.load(os.path.join(predicted_data_path, f'{client}_predicted_.feather'))
+    df = utils.load(predicted_path(client))
     df['Date'] = pd.to_datetime(df['Date'])
     return df
 
 def get_client_data(client):
-    # training data path mapping based on client value
-    training_data = {
-        "morgan" : morgan_train_data_path,
-        "ferrero": ferrero_train_data_path
-        # soon to be added
+    # Read the columns used by the dashboard from the columnar store
+    df = store.read_client(client, columns=store.DASHBOARD_COLUMNS)
+    df["Year"] = df["Inv Date"].dt.year  # Extract Year for Filtering
+
+    return df
+
+def aggregate_actuals(df_train):
+    """
+    Average the invoice lines of every (material, storage, outlier, month),
+    with storage "All" averaging over every storage location, the way the
+    dashboard plots them. Rows are in date order within each series.
+    """
+    agg = {
+        "Total COGS EA": "mean",
+        "Total COGS CTN": "mean",
+        "Total COGS Value": "mean",
+        "Inv Date": "first",  # First invoice date of the month
     }
+    df_train = df_train.sort_values("Inv Date")
 
-    # Get all CSV files in the directory
-    csv_files = glob.glob(os.path.join(training_data[client], "*.csv"))
+    df_specific = df_train.groupby(
+        ["Material Code", "Storage Location Code", "Outlier", "Inv Date (MMM-YYYY)"], observed=True
+    ).agg(agg).reset_index()
 
-    # Read each CSV into a DataFrame and store them in a list
-    dataframes = [pd.read_csv(file) for file in csv_files]
+    df_all = df_train.groupby(
+        ["Material Code", "Outlier", "Inv Date (MMM-YYYY)"], observed=True
+    ).agg(agg).reset_index()
+    df_all["Storage Location Code"] = "All"
 
-    # Optionally, concatenate all DataFrames into one
-    df = pd.concat(dataframes, ignore_index=True).reset_index(drop=True)
+    df_actuals = pd.concat([df_specific.astype({"Storage Location Code": object}), df_all], ignore_index=True)
+    return df_actuals.sort_values("Inv Date", kind="stable")
 
-    df["Inv Date"] = pd.to_datetime(df["Inv Date"])
-    df["Year"] = df["Inv Date"].dt.year  # Extract Year for Filtering
+def build_query_index(df_train, df_predicted):
+    """
+    Pre-aggregate a client once so every dashboard selection is a
+    dictionary lookup: monthly actuals keyed by (material, storage,
+    outlier) and forecasts keyed by (material, COGS type, storage), each
+    key pointing at a contiguous block of rows.
+    """
+    df_actuals, actuals_index = utils.partition_series(
+        aggregate_actuals(df_train), ["Material Code", "Storage Location Code", "Outlier"]
+    )
+
+    return {
+        "actuals": (df_actuals, actuals_index),
+        "predicted": index_predicted(df_predicted),
+        "storages": df_train["Storage Location Code"].dropna().unique().tolist(),
+        "materials": df_train["Material Code"].dropna().unique().tolist(),
+        "years": sorted(df_train["Inv Date"].dt.year.unique(), reverse=True),
+    }
+
+def index_predicted(df_predicted):
+    """
+    Forecasts keyed by (material, COGS type, storage), see build_query_index.
+    """
+    df_predicted = df_predicted.sort_values("Date", kind="stable")
+    df_predicted["Inv Date (MMM-YYYY)"] = df_predicted["Date"].dt.strftime("%b - %Y")
+    return utils.partition_series(df_predicted, ["Material Code", "COGS Type", "Storage Location Code"])
+
+def files_version(paths):
+    version = []
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            version.append((os.path.basename(path), stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+def client_version(client):
+    """
+    Modification times and sizes of the files a client index is built
+    from, as (training data, forecasts): the source CSVs (or the store
+    files when there are none) and the forecast feather. Any change
+    gives a new version.
+    """
+    paths = sorted(glob.glob(os.path.join(train_data_path, client, "*.csv")))
+    if not paths:
+        paths = sorted(glob.glob(os.path.join(store_data_path, client, "year=*", "*.parquet")))
+    return files_version(paths), files_version([predicted_path(client)])
+
+def index_size_mb(index):
+    return sum(
+        index[name][0].memory_usage(deep=True).sum() for name in ("actuals", "predicted")
+    ) / (1024 * 1024)
+
+class ClientCache(object):
+    """
+    Process-wide LRU cache of client query indexes, shared by every
+    dashboard session. An entry is rebuilt when the files of its client
+    change, only its forecasts when just the forecast file changed, and
+    the least recently used clients are evicted once the indexes grow
+    over `max_size_mb`. The most recent client is always kept, even
+    alone over budget.
+    """
 
+    def __init__(self, max_size_mb=1024):
+        self.max_size_mb = max_size_mb
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, client):
+        version = client_version(client)
+        with self.lock:
+            entry = self.entries.get(client)
+            if entry is not None and entry["version"] == version:
+                self.entries.move_to_end(client)
+                return entry["index"], version
+
+            # Built under the lock so concurrent sessions share a single load
+            self.entries.pop(client, None)
+            if entry is not None and entry["version"][0] == version[0]:
+                # Refreshed forecasts, the actuals are unchanged
+                index = {**entry["index"], "predicted": index_predicted(get_predicted_data(client))}
+            else:
+                index = build_query_index(get_client_data(client), get_predicted_data(client))
+            self.entries[client] = {"version": version, "index": index, "size_mb": index_size_mb(index)}
+
+            while len(self.entries) > 1 and sum(e["size_mb"] for e in self.entries.values()) > self.max_size_mb:
+                self.entries.popitem(last=False)
+
+            return index, version
+
+@st.cache_resource
+def get_client_cache():
+    # One cache per server process, created on first use
+    params = utils.read_yaml(os.path.join(config_path, "main_config.yaml"), render=True, suffix="")
+    return ClientCache(params["dashboard_params"]["max_cache_mb"])
+
+@st.cache_resource
+def get_refresh_queue():
+    # One background refresh queue per server process, its workers start with the first job
+    params = utils.read_yaml(os.path.join(config_path, "main_config.yaml"), render=True, suffix="")
+    return RefreshQueue(
+        workers=params["dashboard_params"]["refresh_workers"],
+        timeout=params["fit_params"]["series_timeout"] or None,
+    )
+
+def request_refresh(client, material, storage):
+    """
+    Queue a background refit of a selection, its forecasts replace the
+    ones of the client's forecast file when done.
+    """
+    return get_refresh_queue().submit(client, material, storage, predicted_path(client))
+
+def refresh_status(client, material, storage):
+    """
+    Latest refresh job of a selection, None if never refreshed.
+    """
+    return get_refresh_queue().status(client, material, storage)
+
+@st.experimental_fragment(run_every=2)
+def refresh_indicator(client, material, storage, version):
+    """
+    Progress of the refresh of a selection, polled in the background.
+    The whole app reruns once the refreshed forecasts are saved, so the
+    chart picks them up.
+    """
+    job = refresh_status(client, material, storage)
+    if job is None:
+        return
+    if job["finished"] is None:
+        st.caption(f"Refreshing the forecasts of {material} ({job['status']})...")
+    elif client_version(client) != version:
+        st.rerun()
+    elif job["status"] == "done":
+        st.caption(f"Forecasts refreshed in {job['finished'] - job['submitted']:.1f}s")
+    else:
+        st.caption(f"Refresh failed: {'; '.join(job['errors']) or 'no series to forecast'}")
+
+def get_query_index(client):
+    """
+    Query index of a client and its version, loaded once per server
+    process and reloaded when the client files change.
+    """
+    return get_client_cache().get(client)
+
+def _lookup(frame, index, key, date_column, year):
+    rows = index.get(key)
+    df = frame.iloc[rows] if rows is not None else frame.iloc[:0]
+    if year != "Whole":
+        df = df[df[date_column].dt.year == year]
     return df
 
+@st.cache_data(max_entries=1024)
+def query_actuals(client, version, material, storage, year):
+    """
+    Monthly baseline and outlier actuals of a selection, `version` of
+    the client files is part of the memoization key.
+    """
+    df_actuals, index = get_query_index(client)[0]["actuals"]
+    baseline_df = _lookup(df_actuals, index, (material, storage, False), "Inv Date", year)
+    outlier_df = _lookup(df_actuals, index, (material, storage, True), "Inv Date", year)
+    return baseline_df, outlier_df
+
+@st.cache_data(max_entries=1024)
+def query_predicted(client, version, material, cogs_type, storage, year):
+    """
+    Baseline and outlier forecasts of a selection, `version` of the
+    client files is part of the memoization key.
+    """
+    df_predicted, index = get_query_index(client)[0]["predicted"]
+    df = _lookup(df_predicted, index, (material, cogs_type, str(storage)), "Date", year)
+    return df[df["Outlier"] != True], df[df["Outlier"] == True]
+
 def plot(baseline_df, outlier_df, cogs_column, year_option, df_predicted_filtered_baseline, df_predicted_filtered_outlier):
     # Create Plotly Line Chart
     fig = px.line()
@@ -0,0 +1,142 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Column order of the client CSVs (e.g. data/training/morgan/Morgan_2022.csv)
+CSV_COLUMNS = [
+    "Inv Date",
+    "Inv Date (MMM-YYYY)",
+    "Material Group Code",
+    "Material Group Desc",
+    "Material Code",
+    "Material Desc",
+    "Plant Code",
+    "Storage Location Code",
+    "Storage Location Desc",
+    "Payer Customer Group",
+    "Payer Customer Group 1",
+    "Payer Customer",
+    "Total COGS EA",
+    "Total COGS CTN",
+    "Total COGS Value",
+    "Sales Department Code",
+    "Inv - Net NV1",
+    "IsFestive",
+    "Status",
+    "Outlier",
+]
+
+
+def generate_invoices(
+    n_skus=200,
+    n_storages=7,
+    years=(2022, 2023, 2024),
+    invoices_per_month=3.0,
+    active_share=0.4,
+    outlier_share=0.03,
+    seed=0,
+):
+    """
+    Generate synthetic invoice lines shaped like the client CSVs.
+
+    Every SKU sells from a random subset of the storage locations with a
+    Poisson number of invoices per month, a yearly seasonal pattern and
+    SKU-specific unit costs, so the series are sparse and short like the
+    real ones.
+
+    Parameters
+    ----------
+    n_skus: int, default = 200
+        Number of material codes
+    n_storages: int, default = 7
+        Number of storage location codes
+    years: tuple of int, default = (2022, 2023, 2024)
+        Invoice years
+    invoices_per_month: float, default = 3.0
+        Mean number of invoices per active (material, storage) and month
+    active_share: float, default = 0.4
+        Share of (material, storage) pairs with any sales
+    outlier_share: float, default = 0.03
+        Share of invoice lines flagged as outliers
+    seed: int, default = 0
+        Random seed
+    """
+    rng = np.random.default_rng(seed)
+    months = pd.date_range(f"{min(years)}-01-01", f"{max(years)}-12-01", freq="MS")
+
+    material_codes = 110000000 + rng.choice(1000000, n_skus, replace=False)
+    storage_codes = rng.choice(np.arange(1000, 4000), n_storages, replace=False).astype(float)
+    storage_descs = np.array([f"Storage {i}".ljust(50) for i in range(n_storages)])
+    unit_costs = rng.lognormal(5, 1, n_skus)
+
+    # Active (material, storage) pairs, every SKU sells somewhere
+    active = rng.random((n_skus, n_storages)) < active_share
+    active[np.arange(n_skus), rng.integers(0, n_storages, n_skus)] = True
+    pair_sku, pair_storage = np.nonzero(active)
+
+    # Invoices per pair and month with a yearly seasonality
+    phase = rng.uniform(0, 2 * np.pi, len(pair_sku))
+    season = 1 + 0.4 * np.sin(2 * np.pi * np.arange(len(months))[None, :] / 12 + phase[:, None])
+    rate = rng.gamma(2, invoices_per_month / 2, len(pair_sku))[:, None] * season
+    counts = rng.poisson(rate)
+
+    # One row per invoice line
+    pair_idx, month_idx = np.nonzero(counts)
+    repeats = counts[pair_idx, month_idx]
+    pair_idx = np.repeat(pair_idx, repeats)
+    month_idx = np.repeat(month_idx, repeats)
+    sku_idx = pair_sku[pair_idx]
+    storage_idx = pair_storage[pair_idx]
+    n_rows = len(pair_idx)
+
+    month_start = months[month_idx]
+    inv_date = month_start + pd.to_timedelta(rng.integers(0, 28, n_rows), unit="D")
+    quantity = np.maximum(rng.geometric(0.2, n_rows) - rng.binomial(1, 0.05, n_rows) * 3, -10)
+    value = np.round(quantity * unit_costs[sku_idx] * rng.lognormal(0, 0.1, n_rows), 2)
+
+    df = pd.DataFrame({
+        "Inv Date": inv_date.strftime("%Y-%m-%d"),
+        "Inv Date (MMM-YYYY)": month_start.strftime("%b - %Y"),
+        "Material Group Code": 179,
+        "Material Group Desc": "SYNTHETIC",
+        "Material Code": material_codes[sku_idx],
+        "Material Desc": np.char.add("SKU ", material_codes[sku_idx].astype(str)),
+        "Plant Code": rng.choice(["MY01", "MY02"], n_rows),
+        "Storage Location Code": storage_codes[storage_idx],
+        "Storage Location Desc": storage_descs[storage_idx],
+        "Payer Customer Group": rng.choice([f"GROUP {i}" for i in range(20)], n_rows),
+        "Payer Customer Group 1": " ()",
+        "Payer Customer": rng.choice([f"CUSTOMER {i}" for i in range(500)], n_rows),
+        "Total COGS EA": quantity,
+        "Total COGS CTN": quantity.astype(float),
+        "Total COGS Value": value,
+        "Sales Department Code": "E6",
+        "Inv - Net NV1": np.round(value * 1.3, 2),
+        "IsFestive": rng.random(n_rows) < 0.3,
+        "Status": "Active",
+        "Outlier": rng.random(n_rows) < outlier_share,
+    }, columns=CSV_COLUMNS)
+
+    return df.sort_values("Inv Date", kind="stable").reset_index(drop=True)
+
+
+def write_client_csvs(df, output_dir, client="synthetic"):
+    """
+    Write invoice lines as one CSV per year, named like the client files
+    (e.g. Synthetic_2022.csv).
+
+    Returns
+    -------
+    list of the written CSV paths
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    paths = []
+    years = df["Inv Date"].str[:4]
+    for year, df_year in df.groupby(years):
+        path = os.path.join(output_dir, f"{client.capitalize()}_{year}.csv")
+        df_year.to_csv(path, index=False)
+        paths.append(path)
+
+    return paths
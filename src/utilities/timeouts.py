@@ -0,0 +1,34 @@
+import signal
+import threading
+
+from contextlib import contextmanager
+
+
+class FitTimeout(BaseException):
+    """
+    Raised inside a series fit that ran out of time. Not an Exception,
+    so the handlers of failed candidates in train_predict let it through.
+    """
+
+
+@contextmanager
+def time_limit(seconds):
+    """
+    Raise FitTimeout in the enclosed block once `seconds` of wall-clock
+    time have passed, with SIGALRM. No limit when `seconds` is None or
+    off the main thread, where signals are not delivered.
+    """
+    if seconds is None or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def expire(signum, frame):
+        raise FitTimeout(f"Fit exceeded {seconds:.1f}s")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, max(seconds, 0.001))
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
@@ -1,113 +1,46 @@
-import os
-import sys
-import glob
-import re
-import gzip
-import pickle
-import yaml
-import feather
+import importlib
 
 import numpy as np
-import warnings
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-from datetime import datetime, timedelta
-from jinja2 import Template
-from loguru import logger
-
-from itertools import product
-from pmdarima import auto_arima
-from statsmodels.tsa.statespace.sarimax import SARIMAX
-
-
-def save(data, filename):
-    folders = os.path.dirname(filename)
-    if folders:
-        os.makedirs(folders, exist_ok=True)
-
-    fl = filename.lower()
-    if fl.endswith(".gz"):
-        if fl.endswith(".feather.gz") or fl.endswith(".fthr.gz"):
-            # Since feather doesn't support writing to the file handle, we
-            # can't easily point it to gzip.
-            raise NotImplementedError(
-                "Saving to compressed .feather not currently supported."
-            )
-        else:
-            fp = gzip.open(filename, "wb")
-            pickle.dump(data, fp, protocol=pickle.HIGHEST_PROTOCOL)
-    else:
-        if fl.endswith(".feather") or fl.endswith(".fthr"):
-            if str(type(data)) != "<class 'pandas.core.frame.DataFrame'>":
-                raise TypeError(
-                    ".feather format can only be used to save pandas "
-                    "DataFrames"
-                )
-            feather.write_dataframe(data, filename)
-        else:
-            fp = open(filename, "wb")
-            pickle.dump(data, fp, protocol=pickle.HIGHEST_PROTOCOL)
-
-
-def load(filename):
-    """
-    Loads data saved with save() (or just normally saved with pickle).
-    Autodetects gzip if filename ends in '.gz'
-    Also reads feather files denoted .feather or .fthr.
 
-    Parameters
-    ----------
-    filename -- String with the relative filename of the pickle/feather
-    to load.
-    """
-    fl = filename.lower()
-    if fl.endswith(".gz"):
-        if fl.endswith(".feather.gz") or fl.endswith(".fthr.gz"):
-            raise NotImplementedError("Compressed feather is not supported.")
-        else:
-            fp = gzip.open(filename, "rb")
-            return pickle.load(fp)
-    else:
-        if fl.endswith(".feather") or fl.endswith(".fthr"):
-            import feather
-
-            return feather.read_dataframe(filename)
-        else:
-            fp = open(filename, "rb")
-            return pickle.load(fp)
-        
-
-def read_yaml(filename, render=False, **kwargs):
-    """
-    Read yaml configuation and returns the dict
-
-    Parameters
-    ----------
-    filename: string
-        Path including yaml file name
-    render: Boolean, default = False
-        Template rendering
-    **kwargs:
-        Template render args to be passed
-    """
-    if render:
-        yaml_text = Template(open(filename, "r").read())
-        yaml_text = yaml_text.render(**kwargs)
-        config = yaml.safe_load(yaml_text)
-    else:
-        with open(filename) as f:
-            config = yaml.safe_load(f)
-
-    return config
+from src.utilities.io_ import save, load, read_yaml
+from src.utilities.constants import (
+    SARIMAX_ORDER, SEASONAL_ORDER, SEASONAL_OPTIONS, FORECAST_STEPS, MIN_OBSERVATIONS, SEASONAL_ACF_MIN,
+)
+
+# Names served by submodules imported on first access, so that importing
+# utils does not load statsmodels, matplotlib or seaborn
+LAZY_SUBMODULES = {
+    "src.utilities.modeling": [
+        "ETS_GRID", "ETS_DAMPING", "INTERMITTENT_ADI", "TSB_ALPHA", "TSB_BETA",
+        "sarimax_forecast", "fit_candidate", "seasonal_autocorrelation", "screen_seasonal_periods", "train_predict",
+        "batch_train_predict", "min_series_length", "classify_series",
+        "seasonal_naive_forecast", "tsb_forecast", "fast_forecast", "rolling_forecasts",
+        "rolling_fast_forecasts", "forecast_accuracy", "postprocess",
+    ],
+    "src.utilities.plotting": ["early_plot", "plot_forecast"],
+}
+_LAZY_NAMES = {name: module for module, names in LAZY_SUBMODULES.items() for name in names}
+
+def __getattr__(name):
+    module = _LAZY_NAMES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    # Bind the name so later lookups skip this hook
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_NAMES))
 
 def preprocess_df(df, outlier):
     # Filter by outlier type
     df = df[df['Outlier'] == outlier]
 
     # Group by 'Inv Date (MMM-YYYY)' and calculate the average 'Total COGS Value'
-    df_grouped = df.groupby(['Inv Date (MMM-YYYY)', 'Material Code', 'Storage Location Code'], as_index=False).agg(
+    df_grouped = df.groupby(['Inv Date (MMM-YYYY)', 'Material Code', 'Storage Location Code'], as_index=False, observed=True).agg(
         {
             'Material Group Code' : 'first',
             'Material Group Desc' : 'first',
@@ -127,102 +60,17 @@ def preprocess_df(df, outlier):
     }, inplace=True)
 
     # Convert 'Inv Date (MMM-YYYY)' to datetime format
-    df_grouped['Date'] = pd.to_datetime(df_grouped['Inv Date (MMM-YYYY)'], format='%b - %Y')
+    df_grouped['Date'] = pd.to_datetime(df_grouped['Inv Date (MMM-YYYY)'].astype(str), format='%b - %Y')
 
-    # Sort DataFrame by date
-    df_grouped = df_grouped.sort_values("Date")
+    # Sort DataFrame by date, then by series so the order does not depend on how the rows were read
+    df_grouped = df_grouped.sort_values(["Date", "Material Code", "Storage Location Code"], kind="stable")
     df_grouped.reset_index(drop=True, inplace=True)
 
     return df_grouped
 
-def early_plot(df, column):
-    # Column could be AVG Total RM, EA / CTN
-    # Plot
-    plt.figure(figsize=(10, 5))
-    sns.lineplot(x=df["Date"], y=df[column], marker='o', linestyle='-')
-
-    # Labels & Title
-    plt.xlabel("Invoice Date")
-    plt.ylabel(column)
-    plt.title(f"{column} Over Time")
-    plt.xticks(rotation=45)  # Rotate x-axis labels for better readability
-    plt.grid(True)
-
-    # Show plot
-    plt.show()
-
-def train_predict(df, column):
-    # Column could be AVG Total RM, EA / CTN
-    # Suppress warnings
-    warnings.filterwarnings("ignore")
-
-    # Sort values to ensure correct order
-    df_base_sample = df.sort_values("Date").reset_index(drop=True)
-
-    # List of seasonal values to try (prioritizing 12 and 6, then smaller values if needed)
-    seasonal_options = [12, 8, 6, 4, 3, 2]
-
-    for seasonal_period in seasonal_options:
-        try:
-            # Define SARIMA model
-            model = SARIMAX(df_base_sample[column], 
-                            order=(1,1,1),       
-                            seasonal_order=(1,1,1,seasonal_period),  
-                            enforce_stationarity=False,
-                            enforce_invertibility=False)
-
-            model_fit = model.fit(disp=False)
-            
-            # Forecast next 12 months
-            forecast = model_fit.forecast(steps=24)
-
-            # Replace negative values with 0
-            forecast[forecast < 0] = 0
-            
-            # Explosion check: If the forecast exceeds 5 * max actual value, it's unstable
-            if (forecast.abs().max() > 3 * df_base_sample[column].max()):
-                # print(f"⚠️ Forecast exploded with seasonal order {seasonal_period}, trying next...")
-                continue
-            
-            # print(f"Model trained successfully with seasonal order {seasonal_period}")
-            return forecast  # Return forecast if successful
-        
-        except Exception as e:
-            logger.info(f"Model failed with seasonal order {seasonal_period}: {e}")
-            continue
-
-    logger.info("No valid SARIMAX model could be trained. Consider removing seasonality.")
-    return None  # Return None if all attempts fail
-
-def postprocess(df_base_sample, forecast, column, plot):
-    # Column could be AVG Total RM, EA / CTN
-    # Get the last date in the dataset
-    last_date = df_base_sample['Date'].max()
-
-    # Generate future dates for the next 12 months, keeping the day as 1
-    future_dates = pd.date_range(start=last_date + pd.DateOffset(months=1),  # Start from next month
-                                periods=24,  # Generate 12 months
-                                freq='MS')   # 'MS' ensures the 1st day of each month
-
-
-    if plot:
-        # Plot actual data and forecast
-        plt.figure(figsize=(10, 5))
-        plt.plot(df_base_sample.Date, df_base_sample[column], label="Actual Data", marker='o')
-        plt.plot(future_dates, forecast, label="Forecast", linestyle='dashed', marker='x', color='red')
-
-        plt.xlabel("Date")
-        plt.ylabel(column)
-        plt.title(f"Corrected Forecast of {column}")
-        plt.legend()
-        plt.grid(True)
-        plt.show()
-    
-    return future_dates
-
 def all_storage_grouper(df):
     # Add this to switch Storage Location to = all
-    df = df.groupby(['Inv Date (MMM-YYYY)', 'Material Code'], as_index=False).agg(
+    df = df.groupby(['Inv Date (MMM-YYYY)', 'Material Code'], as_index=False, observed=True).agg(
             {
                 'Material Group Code' : 'first',
                 'Material Group Desc' : 'first',
@@ -235,10 +83,81 @@ def all_storage_grouper(df):
         )   
     
     # Convert 'Inv Date (MMM-YYYY)' to datetime format
-    df['Date'] = pd.to_datetime(df['Inv Date (MMM-YYYY)'], format='%b - %Y')
+    df['Date'] = pd.to_datetime(df['Inv Date (MMM-YYYY)'].astype(str), format='%b - %Y')
 
-    # Sort DataFrame by date
-    df = df.sort_values("Date")
+    # Sort DataFrame by date, then by material
+    df = df.sort_values(["Date", "Material Code"], kind="stable")
     df.reset_index(drop=True, inplace=True)
     
-    return df
\ No newline at end of file
+    return df
+
+def partition_series(df, keys):
+    """
+    Reorder a grouped frame so every series is one contiguous block and
+    index the row range of each block.
+
+    Series keep the order in which they first appear and rows within a
+    series keep their date order, so `df.iloc[index[key]]` is a
+    zero-copy slice that is ready for train_predict.
+
+    Parameters
+    ----------
+    df: DataFrame
+        Output of preprocess_df or all_storage_grouper
+    keys: list of string
+        Columns identifying a series, e.g. ["Material Code", "Storage Location Code"]
+
+    Returns
+    -------
+    (df, index): the reordered frame and a dict mapping each
+    (material, storage) key to its row slice. Keys on material only
+    use None as storage.
+    """
+    positions = df.groupby(keys, sort=False, observed=True).indices
+
+    # Make every group contiguous, keeping first-appearance order
+    df = df.take(np.concatenate(list(positions.values()))).reset_index(drop=True)
+
+    index = {}
+    start = 0
+    for key, rows in positions.items():
+        key = key if isinstance(key, tuple) else (key, None)
+        index[key] = slice(start, start + len(rows))
+        start += len(rows)
+
+    return df, index
+
+def build_partitions(df, outlier):
+    """
+    Aggregate the raw data once for an outlier setting and partition it
+    for both storage types.
+
+    Parameters
+    ----------
+    df: DataFrame
+        Raw training data
+    outlier: Boolean
+        Outlier setting to aggregate
+
+    Returns
+    -------
+    dict mapping storage type ("Specific", "All") to the
+    (df, index) pair built by partition_series
+    """
+    return partition_grouped(preprocess_df(df, outlier))
+
+def partition_grouped(df_grouped):
+    """
+    Partition the output of preprocess_df for both storage types.
+
+    Returns
+    -------
+    dict mapping storage type ("Specific", "All") to the
+    (df, index) pair built by partition_series
+    """
+    df_all = all_storage_grouper(df_grouped)
+
+    return {
+        "Specific": partition_series(df_grouped, ["Material Code", "Storage Location Code"]),
+        "All": partition_series(df_all, ["Material Code"]),
+    }
@@ -0,0 +1,136 @@
+import os
+import glob
+import json
+
+import numpy as np
+import pandas as pd
+
+from src.utilities.schema import compact_output
+
+# Forecast output columns and the dtype of their preallocated arrays
+RESULT_COLUMNS = {
+    "Date": "datetime64[ns]",
+    "material_group_code": object,
+    "material_group_desc": object,
+    "material_desc": object,
+    "Material Code": object,
+    "Storage Location Code": object,
+    "COGS Type": object,
+    "COGS Value": np.float64,
+    "Outlier": np.bool_,
+    "Method": object,
+    "Fallback": np.bool_,
+}
+
+PROGRESS_NAME = "_progress.jsonl"
+
+
+class ResultWriter(object):
+    """
+    Streams forecast rows into preallocated column arrays and flushes
+    them in batches as parquet parts under `output_dir`. Every flush also
+    records the series it completed, so an interrupted run can resume
+    from the last flushed batch.
+    """
+
+    def __init__(self, output_dir, batch_rows=50000, resume=False):
+        self.output_dir = str(output_dir)
+        self.batch_rows = int(batch_rows)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        progress_file = os.path.join(self.output_dir, PROGRESS_NAME)
+        if not resume or not os.path.exists(progress_file):
+            open(progress_file, "w").close()
+
+        # Parts not recorded in the progress file come from an interrupted flush
+        recorded = self._recorded_parts()
+        for path in glob.glob(os.path.join(self.output_dir, "part-*.parquet")):
+            if os.path.basename(path) not in recorded:
+                os.remove(path)
+
+        self.n_parts = len(recorded)
+        self.columns = {
+            name: np.empty(self.batch_rows, dtype=dtype) for name, dtype in RESULT_COLUMNS.items()
+        }
+        self.n_rows = 0
+        self.pending = []
+
+    @staticmethod
+    def series_key(task):
+        """
+        JSON-friendly identifier of a series task.
+        """
+        storage = task["storage"]
+        return [
+            task["column"],
+            bool(task["outlier"]),
+            task["material"].item() if hasattr(task["material"], "item") else task["material"],
+            storage.item() if hasattr(storage, "item") else storage,
+        ]
+
+    def _progress(self):
+        with open(os.path.join(self.output_dir, PROGRESS_NAME)) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _recorded_parts(self):
+        return {batch["part"] for batch in self._progress() if batch["part"] is not None}
+
+    def done_keys(self):
+        """
+        Keys of the series already flushed by a previous run.
+        """
+        return {tuple(key) for batch in self._progress() for key in batch["series"]}
+
+    def append(self, task, result=None):
+        """
+        Add the forecast rows of a series, `result` maps every result
+        column to either one value or an array of one value per row.
+        A failed series is passed without result so it still counts as done.
+        """
+        if result is not None:
+            n = len(result["Date"])
+            if self.n_rows + n > self.batch_rows:
+                self.flush()
+
+            for name, column in self.columns.items():
+                column[self.n_rows:self.n_rows + n] = result[name]
+            self.n_rows += n
+
+        self.pending.append(self.series_key(task))
+
+    def flush(self):
+        """
+        Write the buffered rows as a new part and record its series.
+        """
+        if not self.pending:
+            return
+
+        # A batch of failed series only records its progress
+        part = None
+        if self.n_rows:
+            part = f"part-{self.n_parts:05d}.parquet"
+            path = os.path.join(self.output_dir, part)
+            df = pd.DataFrame({name: column[:self.n_rows] for name, column in self.columns.items()})
+            df.infer_objects().to_parquet(path + ".tmp", index=False)
+            os.replace(path + ".tmp", path)
+            self.n_parts += 1
+
+        with open(os.path.join(self.output_dir, PROGRESS_NAME), "a") as f:
+            f.write(json.dumps({"part": part, "series": self.pending}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.n_rows = 0
+        self.pending = []
+
+    def read(self):
+        """
+        Read every flushed part back as one DataFrame, with categorical
+        keys.
+        """
+        paths = [os.path.join(self.output_dir, part) for part in sorted(self._recorded_parts())]
+        if not paths:
+            df = pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in RESULT_COLUMNS.items()})
+        else:
+            df = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+        return compact_output(df)
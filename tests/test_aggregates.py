@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+import src.utilities.aggregates as aggregates
+import src.utilities.pipeline as pipeline
+import src.utilities.store as store
+import src.utilities.synthetic as synthetic
+import src.utilities.utils as utils
+
+
+@pytest.fixture(scope="module")
+def client_dirs(tmp_path_factory):
+    # Small synthetic client, written as yearly CSVs and ingested into a store
+    tmp_path = tmp_path_factory.mktemp("client")
+    source_dir, store_dir = str(tmp_path / "training"), str(tmp_path / "store")
+    df = synthetic.generate_invoices(n_skus=20, n_storages=3, years=[2023, 2024], seed=1)
+    synthetic.write_client_csvs(df, source_dir)
+    store.ingest_client("synthetic", force=True, source_dir=source_dir, store_dir=store_dir)
+    return source_dir, store_dir
+
+
+@pytest.fixture(scope="module")
+def both_paths(client_dirs):
+    # In-memory aggregation of the store and chunked aggregation of the CSVs
+    source_dir, store_dir = client_dirs
+    df = store.read_client("synthetic", columns=store.PIPELINE_COLUMNS, source_dir=source_dir, store_dir=store_dir)
+    merged = aggregates.aggregate_client(source_dir, chunk_rows=1000)
+    return df, merged
+
+
+@pytest.mark.parametrize("outlier", pipeline.OUTLIERS)
+def test_chunked_aggregates_match_preprocess_df(both_paths, outlier):
+    df, merged = both_paths
+    pd.testing.assert_frame_equal(
+        aggregates.finalize(merged, outlier), utils.preprocess_df(df, outlier), check_categorical=False
+    )
+
+
+def test_chunked_tasks_match_store_tasks(both_paths):
+    df, merged = both_paths
+    partitions = {outlier: utils.partition_grouped(aggregates.finalize(merged, outlier)) for outlier in pipeline.OUTLIERS}
+
+    for sample in (True, False):
+        expected = pipeline.build_tasks(df, sample, keep_short=True)
+        tasks = pipeline.enumerate_tasks(partitions, sample, keep_short=True)
+        assert [pipeline.result_key(task) for task in tasks] == [pipeline.result_key(task) for task in expected]
+        for task, expected_task in zip(tasks, expected):
+            pd.testing.assert_frame_equal(
+                task["df"].reset_index(drop=True), expected_task["df"].reset_index(drop=True), check_categorical=False
+            )
@@ -0,0 +1,77 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pandas as pd
+import pytest
+
+from src.utilities.serving import ForecastStore, make_server
+
+
+@pytest.fixture
+def server(tmp_path):
+    # Stand-in forecast output of one client with two series
+    path = tmp_path / "stub_predicted.feather"
+    pd.DataFrame({
+        "Date": pd.to_datetime(["2024-07-01", "2024-08-01", "2024-07-01", "2024-08-01"]),
+        "Material Code": [1001, 1001, 1002, 1002],
+        "Storage Location Code": ["All", "All", "2020", "2020"],
+        "COGS Type": ["RM"] * 4,
+        "COGS Value": [1.5, 2.5, 3.0, float("nan")],
+        "Outlier": [False] * 4,
+    }).to_feather(path)
+
+    server = make_server(ForecastStore({"stub": path}), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def request(url, body=None):
+    data = None if body is None else (body if isinstance(body, bytes) else json.dumps(body).encode())
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data)) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+def test_get_forecast(server):
+    status, payload = request(f"{server}/forecast?client=stub&material=1002&storage=2020.0")
+    assert status == 200
+    assert payload["dates"] == ["2024-07-01", "2024-08-01"]
+    assert payload["values"] == [3.0, None]
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("client=stub&material=9999", 404),
+    ("client=other&material=1001", 404),
+    ("client=stub", 400),
+    ("material=1001", 400),
+    ("client=stub&material=1001.5", 400),
+    ("client=stub&material=1001&outlier=maybe", 400),
+])
+def test_get_errors(server, query, expected):
+    assert request(f"{server}/forecast?{query}")[0] == expected
+
+
+def test_batch_answers_null_per_failing_entry(server):
+    status, payload = request(f"{server}/forecast/batch", {"requests": [
+        {"client": "stub", "material": 1001},
+        {"client": "other", "material": 1001},
+        {"client": "stub", "material": None},
+        {"client": "stub", "material": 1001.5},
+        {"client": "stub"},
+        [1, 2],
+        {"client": ["stub"], "material": 1001},
+    ]})
+    assert status == 200
+    assert payload["results"][0]["values"] == [1.5, 2.5]
+    assert payload["results"][1:] == [None] * 6
+
+
+@pytest.mark.parametrize("body", [b"not json", {"queries": []}, {"requests": 5}, [1, 2]])
+def test_batch_malformed_body(server, body):
+    assert request(f"{server}/forecast/batch", body)[0] == 400